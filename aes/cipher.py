@@ -0,0 +1,152 @@
+"""
+Vectorised AES-128 encryption with NumPy.
+
+All functions operate on whole batches at once, either many blocks under one
+key or one or many blocks under many keys. A block is stored as 16 bytes in
+the usual AES byte order, i.e. byte i lives in row i % 4 and column i // 4 of
+the state matrix.
+
+Internally, columns are little endian 32 bit words, i.e. row 0 is the
+lowest byte, stored column-major: an array of shape (4, K) holds the 4
+columns of K states, a key schedule has shape (44, K). The rounds use
+T-tables: SubBytes, ShiftRows & MixColumns of one column are 4 table
+look-ups of words and 3 XORs.
+"""
+import numpy as np
+from aes.lut import RC
+from aes.tables import SBOX, T_TABLES, word
+
+BYTE = np.uint32(0xff)
+
+ZERO = np.zeros(256, dtype=np.uint8)
+# SUB_ROT_WORD[r][a] is S(a) for byte a in row r of a word, moved to its row after RotWord
+SUB_ROT_WORD = np.stack([word(ZERO, ZERO, ZERO, SBOX), word(SBOX, ZERO, ZERO, ZERO),
+                         word(ZERO, SBOX, ZERO, ZERO), word(ZERO, ZERO, SBOX, ZERO)])
+
+
+def sub_rot_word(words: np.ndarray) -> np.ndarray:
+    """SubWord(RotWord(w)) of the key schedule for an array of words."""
+    return (SUB_ROT_WORD[0][words & 0xff] ^ SUB_ROT_WORD[1][(words >> 8) & 0xff]
+            ^ SUB_ROT_WORD[2][(words >> 16) & 0xff] ^ SUB_ROT_WORD[3][words >> 24])
+
+
+def to_words(blocks) -> np.ndarray:
+    """Blocks of shape (..., 16) as words of shape (4, K)."""
+    blocks = np.ascontiguousarray(np.asarray(blocks, dtype=np.uint8).reshape(-1, 16))
+    return blocks.view('<u4').T.copy()
+
+
+def from_words(words: np.ndarray, shape: tuple) -> np.ndarray:
+    """Words of shape (C, K) as blocks of the given shape."""
+    return np.ascontiguousarray(words.T).view(np.uint8).reshape(shape)
+
+
+def expand_key_words(key_words: np.ndarray) -> np.ndarray:
+    """Key schedule of shape (44, K) from the master keys as words of shape (4, K)."""
+    w = np.empty((44, key_words.shape[1]), dtype='<u4')
+    w[:4] = key_words
+    for i in range(4, 44):
+        temp = w[i - 1]
+        if i % 4 == 0:
+            temp = sub_rot_word(temp) ^ np.uint32(RC[i // 4 - 1])
+        np.bitwise_xor(w[i - 4], temp, out=w[i])
+    return w
+
+
+def invert_key_schedule_words(last_round_key_words: np.ndarray) -> np.ndarray:
+    """Key schedule of shape (44, K) from the last round keys as words of shape (4, K)."""
+    w = np.empty((44, last_round_key_words.shape[1]), dtype='<u4')
+    w[40:] = last_round_key_words
+    for i in range(43, 3, -1):
+        temp = w[i - 1]
+        if i % 4 == 0:
+            temp = sub_rot_word(temp) ^ np.uint32(RC[i // 4 - 1])
+        np.bitwise_xor(w[i], temp, out=w[i - 4])
+    return w
+
+
+def expand_key(key) -> np.ndarray:
+    """Compute the 11 round keys of AES-128.
+
+    Args:
+        key: The 16 byte master key, or many keys of shape (K, 16).
+
+    Returns:
+        np.ndarray: The round keys, shape (11, 16) or (K, 11, 16).
+    """
+    key = np.asarray(key, dtype=np.uint8)
+    return from_words(expand_key_words(to_words(key)), key.shape[:-1] + (11, 16))
+
+
+def invert_key_schedule(last_round_keys) -> np.ndarray:
+    """Compute the master keys from last round keys of AES-128.
+
+    Args:
+        last_round_keys: The 16 byte last round key, or many keys of shape (K, 16).
+
+    Returns:
+        np.ndarray: The master keys, same shape as the input.
+    """
+    last_round_keys = np.asarray(last_round_keys, dtype=np.uint8)
+    return from_words(invert_key_schedule_words(to_words(last_round_keys))[:4], last_round_keys.shape)
+
+
+def inject_fault(state: np.ndarray, fault_byte: int, fault_values) -> np.ndarray:
+    """XOR fault values into one byte of states given as words."""
+    state = state.copy()
+    state[fault_byte // 4] ^= np.asarray(fault_values, dtype='<u4') << np.uint32(8 * (fault_byte % 4))
+    return state
+
+
+def encrypt_words(plaintext_words: np.ndarray, schedule: np.ndarray, fault_round: int = None,
+                  fault_byte: int = 0, fault_values=None) -> np.ndarray:
+    """Encrypt with AES-128 on words, see encrypt().
+
+    Args:
+        plaintext_words (np.ndarray): The plaintexts as words, shape (4, N).
+        schedule (np.ndarray): The key schedules, shape (44, K). N and K are equal or one of them is 1.
+
+    Returns:
+        np.ndarray: The ciphertexts as words, shape (4, max(N, K)).
+    """
+    state = plaintext_words ^ schedule[:4]
+    for rnd in range(1, 10):
+        if rnd == fault_round:
+            state = inject_fault(state, fault_byte, fault_values)
+        columns = np.empty_like(state)
+        for c in range(4):
+            column = T_TABLES[0][state[c] & BYTE]
+            column ^= T_TABLES[1][(state[(c + 1) % 4] >> 8) & BYTE]
+            column ^= T_TABLES[2][(state[(c + 2) % 4] >> 16) & BYTE]
+            column ^= T_TABLES[3][state[(c + 3) % 4] >> 24]
+            np.bitwise_xor(column, schedule[4 * rnd + c], out=columns[c])
+        state = columns
+    if fault_round == 10:
+        state = inject_fault(state, fault_byte, fault_values)
+    columns = np.empty_like(state)
+    for c in range(4):
+        columns[c] = word(SBOX[state[c] & BYTE], SBOX[(state[(c + 1) % 4] >> 8) & BYTE],
+                          SBOX[(state[(c + 2) % 4] >> 16) & BYTE], SBOX[state[(c + 3) % 4] >> 24])
+        columns[c] ^= schedule[40 + c]
+    return columns
+
+
+def encrypt(plaintexts, round_keys: np.ndarray, fault_round: int = None, fault_byte: int = 0,
+            fault_values=None) -> np.ndarray:
+    """Encrypt a batch of blocks with AES-128, optionally injecting a fault.
+
+    Args:
+        plaintexts: The plaintexts, shape (N, 16).
+        round_keys (np.ndarray): The round keys as returned by expand_key(), either of one key, shape (11, 16),
+            or of one key per block, shape (N, 11, 16). With a single plaintext, any number of keys is possible.
+        fault_round (int, optional): Round (1..10) at whose input the fault is injected.
+        fault_byte (int, optional): State byte the fault is XORed into.
+        fault_values (optional): The non-zero fault values, shape (N,).
+
+    Returns:
+        np.ndarray: The ciphertexts, shape (N, 16) or (K, 16) for K keys.
+    """
+    round_keys = np.ascontiguousarray(round_keys, dtype=np.uint8)
+    schedule = round_keys.reshape(-1, 176).view('<u4').T
+    ciphertexts = encrypt_words(to_words(plaintexts), schedule, fault_round, fault_byte, fault_values)
+    return from_words(ciphertexts, (-1, 16))
@@ -38,46 +38,3 @@ SBOX_INV = (
     0x17, 0x2b, 0x04, 0x7e, 0xba, 0x77, 0xd6, 0x26, 0xe1, 0x69, 0x14, 0x63,0x55, 0x21, 0x0c, 0x7d )  
 
 RC = [0x01, 0x02, 0x04, 0x08, 0x10, 0x20, 0x40, 0x80, 0x1B, 0x36]
-
-#####################################################################
-# Look-Up Functions #################################################
-#####################################################################
-
-def sbox(a: int) -> str:
-    """Get the S-Box value at a given index.
-
-    Args:
-        a (int): The index to get the value for.
-
-    Returns:
-        str: The S-Box value at the given index.
-    """
-    return hex(SBOX[a]) 
-
-def sbox_inv(a: int) -> str:
-    """Get the S-Box value at a given index.
-
-    Args:
-        a (int): The index to get the value for.
-
-    Returns:
-        str: The S-Box value at the given index.
-    """
-    return hex(SBOX_INV[a]) 
-
-def gfmul256(a, b):
-    """
-    Perform multiplication in Galois field.
-    :param int a:
-    :param int b:
-    :return: a * b in GF(2^8)
-    """
-    p = 0
-    while b:
-        if b & 1:
-            p ^= a
-        a <<= 1
-        if a & 0x100:
-            a ^= 0x1b
-        b >>= 1
-    return p & 0xff
\ No newline at end of file
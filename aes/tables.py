@@ -0,0 +1,52 @@
+"""
+Lookup tables of AES as NumPy arrays.
+
+The tables are computed once at import from the constants in aes.lut, which
+takes well below a millisecond, and are shared by the cipher and all
+attacks. The tables are indexed with arrays of any shape, e.g.
+HW[SBOX_INV[ciphertexts ^ key]], so a whole matrix of bytes is looked up at
+once instead of one byte per call.
+
+Columns of the state are encoded as little endian 32 bit words, i.e. row 0
+is the lowest byte.
+"""
+import numpy as np
+from aes.lut import SBOX as SBOX_TUPLE, SBOX_INV as SBOX_INV_TUPLE
+
+BYTES = np.arange(256, dtype=np.uint8)
+
+SBOX = np.array(SBOX_TUPLE, dtype=np.uint8)
+SBOX_INV = np.array(SBOX_INV_TUPLE, dtype=np.uint8)
+# HW[a] is the number of bits set in a
+HW = np.unpackbits(BYTES[:, np.newaxis], axis=1).sum(axis=1).astype(np.uint8)
+# XTIME[a] is 2 * a in GF(2^8)
+XTIME = ((BYTES << 1) ^ np.where(BYTES & 0x80, 0x1b, 0)).astype(np.uint8)
+
+
+def _gf_mul_table() -> np.ndarray:
+    """Multiply all pairs of bytes in GF(2^8) by shift & add over the bits of b."""
+    table = np.zeros((256, 256), dtype=np.uint8)
+    a = BYTES.copy()
+    for bit in range(8):
+        table ^= np.where(BYTES >> bit & 1, a[:, np.newaxis], 0).astype(np.uint8)
+        a = XTIME[a]
+    return table
+
+
+# GF_MUL[a, b] is a * b in GF(2^8)
+GF_MUL = _gf_mul_table()
+
+
+def word(row_0: np.ndarray, row_1: np.ndarray, row_2: np.ndarray, row_3: np.ndarray) -> np.ndarray:
+    """Combine the bytes of the 4 rows of columns into words."""
+    return (row_0.astype('<u4') | row_1.astype('<u4') << 8
+            | row_2.astype('<u4') << 16 | row_3.astype('<u4') << 24)
+
+
+# MIX_COLUMNS[r][a] is the column MixColumns makes of byte a in row r
+MIX_COLUMNS = np.stack([word(GF_MUL[2], BYTES, BYTES, GF_MUL[3]),
+                        word(GF_MUL[3], GF_MUL[2], BYTES, BYTES),
+                        word(BYTES, GF_MUL[3], GF_MUL[2], BYTES),
+                        word(BYTES, BYTES, GF_MUL[3], GF_MUL[2])])
+# T_TABLES[r][a] is the column SubBytes & MixColumns make of byte a in row r
+T_TABLES = MIX_COLUMNS[:, SBOX]
@@ -1,65 +1,52 @@
-
 import numpy as np
-from Crypto.Cipher import AES
-from aes.lut import sbox, RC
+from aes.cipher import encrypt_words, invert_key_schedule, invert_key_schedule_words, to_words
+
+# Number of candidates encrypted at once, the key schedules of a chunk take 176 bytes per candidate
+CHUNK_CANDIDATES = 1 << 16
+
 
 def recover_key(key_round: np.ndarray) -> np.ndarray:
-    """Get the original key from a list of 10 round keys.
+    """Get the original key from the last round key.
 
     Args:
-        key_round (list): The list of round keys.
+        key_round (np.ndarray): The last round key as 16 bytes.
 
     Returns:
-        list: The original key as list of 16 bytes.
+        np.ndarray: The original key as 16 bytes.
     """
-    key_round = np.reshape(key_round, (4,4)).transpose()
-    for round in range(0,10):
-        key_round_previous = key_round
-        key_round[:,3] = key_round_previous[:,3] ^ key_round_previous[:,2]
-        key_round[:,2] = key_round_previous[:,2] ^ key_round_previous[:,1]
-        key_round[:,1] = key_round_previous[:,1] ^ key_round_previous[:,0]
-        key_round[:,0] = function_g(key_round[:,3], 9 - round) ^ key_round_previous[:,0]
-        
-    return np.array(key_round, dtype=np.uint8).flatten(order='F')
+    return invert_key_schedule(key_round)
 
-def function_g(k: list, round: int) -> int:
-    """Calculate the g function when recovering the key.
+
+def test_keys(last_round_keys: np.ndarray, plaintext, ciphertext,
+              chunk_candidates: int = CHUNK_CANDIDATES) -> np.ndarray:
+    """Tests many last round key candidates with one encryption pair.
+
+    The inverted key schedule of a candidate already contains all its round
+    keys, so every candidate costs one key schedule and one encryption.
 
     Args:
-        k (list): The key to calculate the g function for.
-        round (int): The current round.
+        last_round_keys (np.ndarray): The candidates, shape (K, 16).
+        plaintext: The plaintext, 16 bytes.
+        ciphertext: The ciphertext, 16 bytes.
+        chunk_candidates (int, optional): Number of candidates tested at once.
 
     Returns:
-        int: The calculated result for the g function.
+        np.ndarray: Boolean mask of shape (K,), True for the candidates encrypting plaintext to ciphertext.
     """
-    result = []
-    # rotation
-    k = np.roll(k, -1)
-    # sub
-    temp = []
-    for i in range(0,4):
-        temp.append(sbox(int(hex(k[i]),16)))
-    # rcon
-    rcon = [0x00, 0x00, 0x00]
-    rcon.insert(0,RC[round])
-    for byte_a, byte_b in zip(rcon,temp):
-        result.append(byte_a ^ int(byte_b,16))
-    return result
+    last_round_keys = np.reshape(np.asarray(last_round_keys, dtype=np.uint8), (-1, 16))
+    plaintext_words = to_words(plaintext)
+    ciphertext_words = to_words(ciphertext)
+    matches = np.empty(len(last_round_keys), dtype=bool)
+    for start in range(0, len(last_round_keys), chunk_candidates):
+        schedule = invert_key_schedule_words(to_words(last_round_keys[start:start + chunk_candidates]))
+        calculated = encrypt_words(plaintext_words, schedule)
+        matches[start:start + chunk_candidates] = (calculated == ciphertext_words).all(axis=0)
+    return matches
 
 
 def test_key(last_round_key: np.ndarray, plaintext, ciphertext) -> 'tuple(bool, str)':
     """Tests last round key with given encryption pair."""
-
-    # Recover key from last round key
-    key = recover_key(last_round_key)
-    
-    # perform AES encryption with derived key
-    aes = AES.new(key.tobytes(), AES.MODE_ECB)
-    calculated_cipher = np.array(bytearray(aes.encrypt(np.array(plaintext, dtype=np.uint8).tobytes())),
-                                 dtype=np.uint8)
-    
-    # check result with data
-    if (calculated_cipher == ciphertext).all():
-        return True, ''.join([hex(x)[2:].zfill(2).upper() for x in key.tolist()])
+    if test_keys(last_round_key, plaintext, ciphertext)[0]:
+        return True, recover_key(np.asarray(last_round_key, dtype=np.uint8)).tobytes().hex().upper()
     else:
         return False, None
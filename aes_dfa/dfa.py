@@ -7,7 +7,8 @@ Please implement your attack in the function perform_dfa()
 
 import numpy as np
 import reader as rd
-from aes.lut import SBOX_INV, gfmul256
+import instrument
+from aes.tables import GF_MUL, SBOX_INV
 
 class DFA:
     
@@ -15,22 +16,20 @@ class DFA:
         self.reader = rd.DFAReader(input_path)
 
     @staticmethod
+    @instrument.timed('dfa.equation')
     def equation(index_x: int, index_y: int, c: 'list[int]', f_c: 'list[int]', multiplier: int) -> 'list[tuple]':
-        k_candidates = []
-        if multiplier > 1:
-            for k_x in range(256):
-                for k_y in range(256):
-                    if (SBOX_INV[c[index_x] ^ k_x] ^ SBOX_INV[f_c[index_x] ^ k_x]) == gfmul256((SBOX_INV[c[index_y] ^ k_y] ^ SBOX_INV[f_c[index_y] ^ k_y]), multiplier):
-                        k_candidates.append((k_x, k_y))
-        else:
-            for k_x in range(256):
-                for k_y in range(256):
-                    if (SBOX_INV[c[index_x] ^ k_x] ^ SBOX_INV[f_c[index_x] ^ k_x]) == (SBOX_INV[c[index_y] ^ k_y] ^ SBOX_INV[f_c[index_y] ^ k_y]):
-                        k_candidates.append((k_x, k_y))
-                        
+        k = np.arange(256, dtype=np.uint8)
+        # Differences before the last SubBytes for all guesses of k_x & k_y
+        delta_x = SBOX_INV[c[index_x] ^ k] ^ SBOX_INV[f_c[index_x] ^ k]
+        delta_y = GF_MUL[multiplier][SBOX_INV[c[index_y] ^ k] ^ SBOX_INV[f_c[index_y] ^ k]]
+        k_x, k_y = np.nonzero(delta_x[:, np.newaxis] == delta_y[np.newaxis, :])
+        k_candidates = list(zip(k_x.tolist(), k_y.tolist()))
+
+        instrument.count('dfa.equation_candidates', len(k_candidates))
         return k_candidates
 
     @staticmethod
+    @instrument.timed('dfa.filter_candidates')
     def filter_candidates(k_candidates_x: 'list[tuple]', k_candidates_y: 'list[tuple]', k_candidates_z: 'list[tuple]') -> 'list[tuple]':
         filtered_candidates = []
         for k_candidate_x in k_candidates_x:
@@ -39,6 +38,7 @@ class DFA:
                     if k_candidate_x[1] == k_candidate_y[1] == k_candidate_z[1]:
                         filtered_candidates.append((k_candidate_x[0], k_candidate_y[0], k_candidate_z[0], k_candidate_x[1]))
                         
+        instrument.count('dfa.column_candidates', len(filtered_candidates))
         return filtered_candidates
 
     def col_0(self, c: 'list[int]', f_c: 'list[int]') -> 'list[tuple]':
@@ -118,6 +118,7 @@ class DFA:
         return self.filter_candidates(k_candidates_12, k_candidates_9, k_candidates_3)
 
     @staticmethod
+    @instrument.timed('dfa.find_matching_columns')
     def find_matching_columns(possible_columns_0: 'list[tuple]', possible_columns_1: 'list[tuple]') -> tuple:
         matching_columns = []
         for possible_byte_0 in possible_columns_0:
@@ -134,22 +135,55 @@ class DFA:
                     
         return matching_columns[0]
 
-    def perform_dfa(self):
+    @staticmethod
+    def column_candidates(column, c: 'list[int]', f_c: 'list[int]', name: str, checkpoint=None,
+                          cache=None) -> 'list[tuple]':
+        """Calculate the candidates of a column, or take them from the checkpoint or the cache.
+
+        Args:
+            column: One of the col_X() methods.
+            c (list[int]): The list of correct ciphertext bytes.
+            f_c (list[int]): The list of faulty ciphertext bytes.
+            name (str): The name of the candidates in the checkpoint & the cache.
+            checkpoint (Checkpoint, optional): Saves the candidates as array of shape (candidates, 4).
+            cache (CacheEntry, optional): Stores the candidates like the checkpoint.
+
+        Returns:
+            list[tuple]: List of possible key combinations.
+        """
+        if checkpoint is not None and name in checkpoint.state:
+            return [tuple(candidate) for candidate in checkpoint.state[name].tolist()]
+        if cache is not None and name in cache:
+            return [tuple(candidate) for candidate in cache.get(name).tolist()]
+        candidates = column(c, f_c)
+        if checkpoint is not None:
+            checkpoint.update(**{name: np.array(candidates, dtype=np.uint8).reshape(-1, 4)})
+        if cache is not None:
+            cache.put(name, np.array(candidates, dtype=np.uint8).reshape(-1, 4))
+        return candidates
+
+    def perform_dfa(self, checkpoint=None, cache=None):
+        """Recover the last round key from the first 2 faulty pairs.
+
+        Args:
+            checkpoint (Checkpoint, optional): Saves the candidates of every column,
+                the columns of a resumed checkpoint are not calculated again.
+            cache (CacheEntry, optional): Stores the candidates of every column for later runs.
+
+        Returns:
+            list[int]: The last round key.
+        """
         key = np.zeros(16, dtype=np.uint8)
 
         # ...
-        key_hypotheses_0 = [
-            self.col_0(self.reader.ciphertexts[0], self.reader.faulty_ciphertexts[0]),
-            self.col_1(self.reader.ciphertexts[0], self.reader.faulty_ciphertexts[0]),
-            self.col_2(self.reader.ciphertexts[0], self.reader.faulty_ciphertexts[0]),
-            self.col_3(self.reader.ciphertexts[0], self.reader.faulty_ciphertexts[0])
-        ]
-        key_hypotheses_1 = [
-            self.col_0(self.reader.ciphertexts[1], self.reader.faulty_ciphertexts[1]),
-            self.col_1(self.reader.ciphertexts[1], self.reader.faulty_ciphertexts[1]),
-            self.col_2(self.reader.ciphertexts[1], self.reader.faulty_ciphertexts[1]),
-            self.col_3(self.reader.ciphertexts[1], self.reader.faulty_ciphertexts[1])
-        ]
+        # Python integers are a lot faster than NumPy scalars in the loops below
+        c_0, f_c_0 = self.reader.ciphertexts[0].tolist(), self.reader.faulty_ciphertexts[0].tolist()
+        c_1, f_c_1 = self.reader.ciphertexts[1].tolist(), self.reader.faulty_ciphertexts[1].tolist()
+        columns = (self.col_0, self.col_1, self.col_2, self.col_3)
+        key_hypotheses_0 = [self.column_candidates(column, c_0, f_c_0, 'pair_0_col_{}'.format(i), checkpoint, cache)
+                            for i, column in enumerate(columns)]
+        key_hypotheses_1 = [self.column_candidates(column, c_1, f_c_1, 'pair_1_col_{}'.format(i), checkpoint, cache)
+                            for i, column in enumerate(columns)]
         
         correct_column_0 = self.find_matching_columns(key_hypotheses_0[0], key_hypotheses_1[0])
         correct_column_1 = self.find_matching_columns(key_hypotheses_0[1], key_hypotheses_1[1])
@@ -0,0 +1,68 @@
+"""
+Incremental correlation of power traces with the last round model of AES.
+
+The Pearson correlation between every sample and the Hamming weight of
+SB^-1(c ^ k) of every key hypothesis is computed from running sums, so the
+traces can be added batch by batch, e.g. while they are captured or read in
+chunks, and only the sums are kept in memory.
+"""
+import numpy as np
+from aes.tables import HW, SBOX_INV
+
+KEY_HYPOTHESES = np.arange(256, dtype=np.uint8)
+
+
+def hypotheses(ciphertexts: np.ndarray, byte: int) -> np.ndarray:
+    """The H matrix of a key byte: Hamming weights of the last round input, traces x key hypotheses."""
+    return HW[SBOX_INV[ciphertexts[:, byte, np.newaxis] ^ KEY_HYPOTHESES]]
+
+
+class CorrelationAccumulator:
+    """Running sums for the correlation of the traces with all key hypotheses of all 16 bytes."""
+
+    def __init__(self, n_samples: int, dtype=np.float64) -> None:
+        """
+        Args:
+            n_samples (int): The number of samples per trace.
+            dtype (optional): The precision of the products of a batch, which are summed up in float64.
+        """
+        self.n_samples = n_samples
+        self.dtype = dtype
+        self.n_traces = 0
+        # The traces are shifted by the mean of the first batch to avoid cancellation in the variances
+        self.offset = None
+        self.sum_t = np.zeros(n_samples)
+        self.sum_tt = np.zeros(n_samples)
+        self.sum_h = np.zeros((16, 256))
+        self.sum_hh = np.zeros((16, 256))
+        self.sum_ht = np.zeros((16, 256, n_samples))
+
+    def add(self, traces: np.ndarray, ciphertexts: np.ndarray):
+        """Add a batch of traces, shape (N, #samples), and their ciphertexts, shape (N, 16)."""
+        if self.offset is None:
+            self.offset = traces.mean(axis=0, dtype=np.float64)
+        t = traces.astype(self.dtype)
+        t -= self.offset.astype(self.dtype)
+        self.n_traces += len(t)
+        self.sum_t += t.sum(axis=0, dtype=np.float64)
+        self.sum_tt += np.einsum('ij,ij->j', t, t, dtype=np.float64)
+        for byte in range(16):
+            h = hypotheses(ciphertexts, byte).astype(self.dtype)
+            self.sum_h[byte] += h.sum(axis=0, dtype=np.float64)
+            self.sum_hh[byte] += np.einsum('ij,ij->j', h, h, dtype=np.float64)
+            self.sum_ht[byte] += h.T @ t
+
+    def correlation(self, byte: int) -> np.ndarray:
+        """The correlation matrix of a key byte, key hypotheses x samples."""
+        n = self.n_traces
+        covariance = self.sum_ht[byte] - np.outer(self.sum_h[byte], self.sum_t) / n
+        variance_h = self.sum_hh[byte] - self.sum_h[byte] ** 2 / n
+        variance_t = self.sum_tt - self.sum_t ** 2 / n
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = covariance / np.sqrt(np.outer(variance_h, variance_t))
+        r[~np.isfinite(r)] = 0
+        return np.clip(r, -1.0, 1.0)
+
+    def peaks(self) -> np.ndarray:
+        """The maximum absolute correlation over all samples, bytes x key hypotheses."""
+        return np.array([np.absolute(self.correlation(byte)).max(axis=1) for byte in range(16)])
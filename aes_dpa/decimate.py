@@ -0,0 +1,36 @@
+"""
+Min/max envelopes of long lines, e.g. traces or correlations.
+
+A line is reduced to its minimum & maximum in every pixel column of a figure,
+which looks the same as plotting every sample. This module does not depend on
+matplotlib, so the envelopes can be computed (e.g. for the cache) without
+loading it.
+"""
+import numpy as np
+
+FIGURE_SIZE = (6.4, 4.8)
+DPI = 100
+# Horizontal resolution of a figure, the envelopes have 2 points per pixel
+PIXEL_WIDTH = int(FIGURE_SIZE[0] * DPI)
+
+
+def decimate(y: np.ndarray, width: int = PIXEL_WIDTH) -> 'tuple(np.ndarray, np.ndarray)':
+    """Reduce lines to their min/max envelope over width bins.
+
+    Args:
+        y (np.ndarray): The lines along the last axis, e.g. shape (#samples,) or (#hypothesis, #samples).
+        width (int, optional): The number of bins, i.e. pixel columns.
+
+    Returns:
+        tuple(np.ndarray, np.ndarray): The sample indices of the points, shape (#points,),
+            and the points, shape (..., #points). Lines with at most 2 * width samples are returned unchanged.
+    """
+    y = np.asarray(y)
+    n_samples = y.shape[-1]
+    if n_samples <= 2 * width:
+        return np.arange(n_samples), y
+    starts = np.linspace(0, n_samples, width + 1).astype(np.intp)[:-1]
+    envelope = np.empty(y.shape[:-1] + (2 * width,), dtype=y.dtype)
+    envelope[..., 0::2] = np.minimum.reduceat(y, starts, axis=-1)
+    envelope[..., 1::2] = np.maximum.reduceat(y, starts, axis=-1)
+    return np.repeat(starts, 2), envelope
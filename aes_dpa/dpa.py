@@ -5,80 +5,80 @@ DPA Attack on last round key of AES.
 Please implement your attack in the function perform_dpa().
 """
 import reader as rd
+import instrument
 import numpy as np  # numeric calculations and array
-from itertools import product
-from aes.lut import sbox_inv
+from aes.tables import HW, SBOX_INV
+from aes_dpa.accumulator import CorrelationAccumulator
+from aes_dpa import second_order
 
 #####################################################################
 # Functions #########################################################
 #####################################################################
 
-class DPA:
+# Working precision of the correlation: float64 on int16 traces, or float32
+# on the traces in their stored type, e.g. 8 bit, with half the memory
+FLOAT64 = 'float64'
+FLOAT32 = 'float32'
+PRECISIONS = {FLOAT64: np.float64, FLOAT32: np.float32}
 
-    def __init__(self, traces_path: str):
-        self.reader = rd.DPAReader(traces_path)
-        self.window_size = len(self.reader.ciphertexts)  
-    
-    def __hw(self, n: int) -> int:
-        """Compute the Hamming weight of a given integer.
+class DPA:
 
+    def __init__(self, traces_path: str, precision: str = FLOAT64, chunk_traces: int = None,
+                 prefetch: int = rd.DPA_PREFETCH_DEPTH):
+        """
         Args:
-            n (int): The integer to get the Hamming weight for.
-
-        Returns:
-            int: The Hamming weight of the given integer.
+            traces_path (str): The HDF5 file with the traces.
+            precision (str, optional): The working precision of the correlation, see PRECISIONS.
+            chunk_traces (int, optional): Correlate the traces in chunks of this many traces instead of
+                loading all of them, the next chunks are read while the current one is correlated.
+            prefetch (int, optional): The number of chunks read ahead.
         """
-        c = 0
-        while n:
-            c +=1
-            n &= n-1
-        return c
-
-    def __generate_key_hyp(self) -> list:
-        """Generate a list of all possible key hypotheses for 1 key byte.
+        if precision not in PRECISIONS:
+            raise ValueError("Unknown precision {}.".format(precision))
+        self.dtype = PRECISIONS[precision]
+        self.chunk_traces = chunk_traces
+        self.prefetch = prefetch
+        self.reader = rd.DPAReader(traces_path, dtype=np.int16 if precision == FLOAT64 else None,
+                                   load_traces=chunk_traces is None)
+        self.window_size = len(self.reader.ciphertexts)  
+    
+    def __generate_key_hyp(self) -> np.ndarray:
+        """Generate all possible key hypotheses for 1 key byte.
 
         Returns:
-            list: The list of all possible key hypotheses.
+            np.ndarray: The 256 key hypotheses.
         """
-        key = []
-        for k in range(0,256):
-            key.append(k)
-        return key
+        return np.arange(256, dtype=np.uint8)
 
-    def __compute_T(self) -> np.ndarray:
-        """Generate the T matrix out of the traces.
+    def __compute_T(self) -> 'tuple(np.ndarray, np.ndarray)':
+        """Generate the T matrix out of the traces, centred in the working precision.
 
-        Args:
-            reader (Reader): The Reader object to read the traces.
+        The T matrix is the same for all key bytes, so it is centred only once.
 
         Returns:
-            np.ndarray: The T matrix.
+            tuple(np.ndarray, np.ndarray): The centred T matrix and the sum of squares of every sample.
         """
         # extract window
-        traces_size = len(self.reader.traces[0])
-        self.reader.traces[:self.window_size, :traces_size]
-
-        return np.reshape(self.reader.traces, (self.window_size,traces_size))
+        traces = self.reader.traces[:self.window_size]
+        # The mean is accumulated in float64 even in float32 precision
+        mean = traces.mean(axis=0, dtype=np.float64)
+        tv = traces.astype(self.dtype)
+        tv -= mean.astype(self.dtype)
+        return tv, np.einsum('ij,ij->j', tv, tv, dtype=np.float64)
 
-    def __compute_V(self, byte: int, key: list) -> np.ndarray:
+    def __compute_V(self, byte: int, key: np.ndarray) -> np.ndarray:
         """Compute the V matrix.
 
         Args:
-            reader (Reader): The reader class to read the plaintexts and ciphertexts.
             byte (int): The current byte to compute the V matrix for.
-            key (list): The list of key hypotheses.
+            key (np.ndarray): The key hypotheses.
 
         Returns:
-            np.ndarray: The V matrix.
+            np.ndarray: The V matrix, traces x key hypotheses.
         """
         d = self.reader.get_ciphertext_column(byte)
         d = d[:self.window_size]
-        v = [[0 for _ in range(len(key))] for _ in range(len(d))]
-        
-        for i, j in product(range(len(d)),range(len(key))):
-            v[i][j] = sbox_inv(d[i]^ key[j])
-            
-        return np.array(v)
+        return SBOX_INV[d[:, np.newaxis] ^ key[np.newaxis, :]]
 
     def __compute_H(self, v: np.ndarray) -> np.ndarray:
         """Generate the H matrix containing the Hamming weights of the V matrix.
@@ -89,35 +89,153 @@ class DPA:
         Returns:
             np.ndarray: The H matrix.
         """
-        h = [[0 for _ in range(len(v[0]))] for _ in range(len(v))]
-
-        for i, j in product(range(len(v)),range(len(v[0]))):
-            h[i][j] = self.__hw(int(v[i,j],16))
-
-        return np.array(h)
+        return HW[v]
 
     # generate R correlation matrix 
-    def __compute_R(self, t: np.ndarray, h: np.ndarray) -> np.ndarray:
+    def __compute_R(self, tv: np.ndarray, tvss: np.ndarray, h: np.ndarray) -> np.ndarray:
         """Compute the correlation matrix R.
 
+        The covariances are computed in the working precision, only the
+        normalisation with the standard deviations is done in float64.
+
         Args:
-            t (np.ndarray): The T matrix.
+            tv (np.ndarray): The centred T matrix.
+            tvss (np.ndarray): The sum of squares of every sample of the centred T matrix.
             h (np.ndarray): The H matrix.
 
         Returns:
-            np.ndarray: The correlation matrix R.
+            np.ndarray: The correlation matrix R, samples x key hypotheses.
         """
-        result = []
-        tv = t - t.mean(axis=0)
-        hv = h - h.mean(axis=0)
-        tvss = (tv * tv).sum(axis=0)
-        hvss = (hv * hv).sum(axis=0)
+        hv = h.astype(self.dtype)
+        hv -= h.mean(axis=0).astype(self.dtype)
+        hvss = np.einsum('ij,ij->j', hv, hv, dtype=np.float64)
 
-        result = np.matmul(tv.transpose(), hv) / np.sqrt(np.outer(tvss, hvss))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = np.matmul(tv.transpose(), hv).astype(np.float64, copy=False) / np.sqrt(np.outer(tvss, hvss))
         result[np.isnan(result)] = 0
         return np.maximum(np.minimum(result, 1.0), -1.0)
 
-    def perform_dpa(self) -> np.ndarray:
+    def __accumulate(self) -> CorrelationAccumulator:
+        """Correlate the traces of all key bytes chunk by chunk, while the next chunks are read.
+
+        Returns:
+            CorrelationAccumulator: The correlation sums of all traces.
+        """
+        accumulator = CorrelationAccumulator(self.reader.traces.shape[1], self.dtype)
+        for _, (traces, ciphertexts, _) in self.reader.read_chunks(self.chunk_traces, self.prefetch,
+                                                                   self.window_size):
+            with instrument.stage('dpa.accumulate'):
+                accumulator.add(traces, ciphertexts)
+        instrument.count('dpa.traces', accumulator.n_traces)
+        instrument.count('dpa.samples', accumulator.n_samples)
+        return accumulator
+
+    def __window_chunks(self, sample_window: 'tuple(int, int)'):
+        """Yield the samples in a window & the ciphertexts of the traces chunk by chunk.
+
+        Args:
+            sample_window (tuple(int, int)): The first & the last + 1 sample.
+        """
+        start, stop = sample_window
+        if self.chunk_traces:
+            for _, (traces, ciphertexts, _) in self.reader.read_chunks(self.chunk_traces, self.prefetch,
+                                                                       self.window_size):
+                yield traces[:, start:stop], ciphertexts
+        else:
+            for first in range(0, self.window_size, rd.DPA_CHUNK_TRACES):
+                last = min(first + rd.DPA_CHUNK_TRACES, self.window_size)
+                yield self.reader.traces[first:last, start:stop], self.reader.ciphertexts[first:last]
+
+    def perform_second_order_dpa(self, sample_window: 'tuple(int, int)', combination: str = second_order.PRODUCT,
+                                 pair_block: int = second_order.PAIR_BLOCK, checkpoint=None) -> np.ndarray:
+        """Recover the last round key of a masked implementation with a second-order CPA.
+
+        All pairs of samples in the window are combined & correlated with the
+        last round model, see aes_dpa.second_order. The location of the best
+        pair of every key hypothesis is kept in self.best_pairs, bytes x key hypotheses x 2.
+
+        Args:
+            sample_window (tuple(int, int)): The first & the last + 1 sample whose pairs are combined.
+            combination (str, optional): How 2 samples are combined, see second_order.COMBINATIONS.
+            pair_block (int, optional): The number of pairs correlated at once.
+            checkpoint (Checkpoint, optional): Saves the best correlations after every block of pairs,
+                a resumed checkpoint continues with the next block.
+
+        Returns:
+            np.ndarray: The last round key.
+        """
+        start, stop = sample_window
+        if not 0 <= start < stop - 1 < self.reader.traces.shape[1]:
+            raise ValueError("The window needs at least 2 samples of the traces.")
+        if combination not in second_order.COMBINATIONS:
+            raise ValueError("Unknown combination {}.".format(combination))
+        first, second = second_order.sample_pairs(stop - start)
+        n_pairs = len(first)
+
+        # Best absolute correlation of every key hypothesis over all pairs & the pair
+        peaks = np.zeros((16, 256))
+        best_pairs = np.zeros((16, 256), dtype=np.intp)
+        done = 0
+        if checkpoint is not None and 'pairs_done' in checkpoint.state:
+            if (checkpoint.state['sample_window'].tolist() == [start, stop]
+                    and str(checkpoint.state['combination']) == combination):
+                done = int(checkpoint.state['pairs_done'])
+                peaks = checkpoint.state['peaks'].copy()
+                best_pairs = checkpoint.state['best_pairs'].copy()
+            else:
+                print("The checkpoint belongs to another window or combination, starting from the beginning.")
+
+        means = None
+        if combination == second_order.PRODUCT and done < n_pairs:
+            with instrument.stage('dpa.sample_means'):
+                sums = np.zeros(stop - start)
+                for traces, _ in self.__window_chunks(sample_window):
+                    sums += traces.sum(axis=0, dtype=np.float64)
+                means = sums / self.window_size
+
+        for block in range(done, n_pairs, pair_block):
+            block_first, block_second = first[block:block + pair_block], second[block:block + pair_block]
+            accumulator = CorrelationAccumulator(len(block_first), self.dtype)
+            for traces, ciphertexts in self.__window_chunks(sample_window):
+                with instrument.stage('dpa.combine'):
+                    combined = second_order.combine(traces, block_first, block_second, combination, means, self.dtype)
+                with instrument.stage('dpa.accumulate'):
+                    accumulator.add(combined, ciphertexts)
+            with instrument.stage('dpa.compute_R'):
+                for byte in range(16):
+                    r_matrix = np.absolute(accumulator.correlation(byte))
+                    block_best = r_matrix.argmax(axis=1)
+                    block_peaks = r_matrix[np.arange(256), block_best]
+                    better = block_peaks > peaks[byte]
+                    peaks[byte, better] = block_peaks[better]
+                    best_pairs[byte, better] = block + block_best[better]
+            instrument.count('dpa.pairs', len(block_first))
+            done = block + len(block_first)
+            if checkpoint is not None:
+                checkpoint.update(sample_window=np.array([start, stop]), combination=np.array(combination),
+                                  pairs_done=np.array(done), peaks=peaks, best_pairs=best_pairs)
+            print("Pairs {}/{}, Last Round Key: {}".format(
+                done, n_pairs, bytes(peaks.argmax(axis=1).tolist()).hex().upper()), end="\r")
+        print("")
+
+        self.best_pairs = np.stack([first[best_pairs], second[best_pairs]], axis=-1) + start
+        return peaks.argmax(axis=1)
+
+    def perform_dpa(self, keep_correlations: bool = False, checkpoint=None, cache=None) -> np.ndarray:
+        """Recover the last round key byte by byte.
+
+        Args:
+            keep_correlations (bool, optional): Whether to keep the correlations of all key hypotheses
+                of every byte in self.correlations for plotting, as (#samples, samples, envelope)
+                decimated by aes_dpa.decimate.decimate().
+            checkpoint (Checkpoint, optional): Saves the finished key bytes (& their correlations),
+                the bytes of a resumed checkpoint are skipped.
+            cache (CacheEntry, optional): Stores the summary of the correlations of every byte, i.e. the
+                peak of every key hypothesis & the decimated correlations, cached bytes are not computed again.
+
+        Returns:
+            np.ndarray: The last round key.
+        """
         # given values:
         # ciphertexts[trace #][byte] = ciphertext        (T,B)   np.uint8
         # traces[trace #][sample] = power-consumption    (T,S)   np.uint8
@@ -126,26 +244,93 @@ class DPA:
         # B, K = 16, 256         #B:number of bytes      #K:number of key hypotheses
 
         # type conversion:
-        # traces = np.float32(traces)
+        # traces = np.float32(traces) with precision float32, see __compute_T()
         
         key = self.__generate_key_hyp()
         round_key = []
-        t_matrix = self.__compute_T()
-
-        # For all bytes in the AES state
-        for byte in range(16):
-            # First compute the V-matrix
-            v_matrix = self.__compute_V(byte, key)
-            # Compute the Hamming-Weight Matrix using the V-matrix
-            h_matrix = self.__compute_H(v_matrix)
-            # Finally use the traces & Hamming-weights to compute the correlation matrix
-            r_matrix = np.absolute(np.array(self.__compute_R(t_matrix, h_matrix)).transpose())
-            # Find the entry with maximum (absolute) correlation & append to the round key
-            round_key_byte = int(np.where(r_matrix ==  np.amax(r_matrix))[0][-1])
+        num_samples = self.reader.traces.shape[1]
+        # The T matrix (or the sums of the chunks) is only computed once a byte is neither checkpointed nor cached
+        t_matrix = None
+        accumulator = None
+        if keep_correlations or cache is not None:
+            from aes_dpa.decimate import decimate
+        if keep_correlations:
+            self.correlations = []
+        if checkpoint is not None and 'round_key' in checkpoint.state:
+            # Without their correlations, finished bytes are computed again for plotting
+            if not keep_correlations or 'envelopes' in checkpoint.state:
+                round_key = checkpoint.state['round_key'].tolist()
+            if keep_correlations and round_key:
+                self.correlations = [(num_samples, checkpoint.state['samples'], envelope)
+                                     for envelope in checkpoint.state['envelopes']]
+
+        # For all bytes in the AES state, continuing after the finished ones
+        for byte in range(len(round_key), 16):
+            peaks = cache.get('peaks_{}'.format(byte)) if cache is not None else None
+            if peaks is not None:
+                samples, envelope = cache.get('samples'), cache.get('envelope_{}'.format(byte))
+            else:
+                if self.chunk_traces:
+                    if accumulator is None:
+                        accumulator = self.__accumulate()
+                    with instrument.stage('dpa.compute_R'):
+                        r_signed = accumulator.correlation(byte).T
+                else:
+                    if t_matrix is None:
+                        with instrument.stage('dpa.compute_T'):
+                            t_matrix, t_squares = self.__compute_T()
+                        instrument.count('dpa.traces', t_matrix.shape[0])
+                        instrument.count('dpa.samples', t_matrix.shape[1])
+                    # First compute the V-matrix
+                    with instrument.stage('dpa.compute_V'):
+                        v_matrix = self.__compute_V(byte, key)
+                    # Compute the Hamming-Weight Matrix using the V-matrix
+                    with instrument.stage('dpa.compute_H'):
+                        h_matrix = self.__compute_H(v_matrix)
+                    # Finally use the traces & Hamming-weights to compute the correlation matrix
+                    with instrument.stage('dpa.compute_R'):
+                        r_signed = self.__compute_R(t_matrix, t_squares, h_matrix)
+                # Maximum (absolute) correlation of every key hypothesis
+                peaks = np.absolute(r_signed).max(axis=0)
+                if keep_correlations or cache is not None:
+                    samples, envelope = decimate(r_signed.T)
+                if cache is not None:
+                    if 'samples' not in cache:
+                        cache.put('samples', samples)
+                        cache.put('num_samples', np.array(num_samples))
+                    cache.put('envelope_{}'.format(byte), envelope.astype(np.float32))
+                    cache.put('peaks_{}'.format(byte), peaks)
+            if keep_correlations:
+                self.correlations.append((num_samples, samples, envelope))
+            # Find the hypothesis with maximum (absolute) correlation & append to the round key
+            round_key_byte = int(np.flatnonzero(peaks == peaks.max())[-1])
             round_key.append(round_key_byte)
+            if checkpoint is not None:
+                state = {'round_key': np.array(round_key, dtype=np.uint8)}
+                if keep_correlations:
+                    state['samples'] = self.correlations[0][1]
+                    state['envelopes'] = np.array([envelope for _, _, envelope in self.correlations], dtype=np.float32)
+                checkpoint.update(**state)
             print("Last Round Key: " + "".join(hex(x)[2:].zfill(2) for x in round_key).upper(), end="\r")
             
         print("")
         
         return np.array(round_key)
 
+
+def cached_correlations(cache) -> list:
+    """The correlations of all key bytes stored in the cache by DPA.perform_dpa(), as in DPA.correlations.
+
+    Args:
+        cache (CacheEntry): The cache entry of a finished DPA.
+
+    Returns:
+        list: (#samples, samples, envelope) of every key byte, None if some are missing, e.g. the bytes
+            of a run resumed from a checkpoint.
+    """
+    names = ['num_samples', 'samples'] + ['envelope_{}'.format(byte) for byte in range(16)]
+    if not all(name in cache for name in names):
+        return None
+    num_samples = int(cache.get('num_samples'))
+    samples = cache.get('samples')
+    return [(num_samples, samples, cache.get('envelope_{}'.format(byte))) for byte in range(16)]
@@ -0,0 +1,316 @@
+"""
+Live DPA on traces as they are captured.
+
+The records (trace, plaintext, ciphertext) are read with asyncio from one of
+these sources:
+    - socket: a Unix socket this module listens on, the capture connects to it
+    - pipe: a named pipe or '-' for the standard input
+    - hdf5: an HDF5 file in the layout of DPAReader which grows while it is
+      written in SWMR mode, read until the writer closes it
+
+Sockets & pipes carry a JSON header line with the number of samples & the
+sample type, e.g. {"samples": 1000, "dtype": "uint8"}, followed by the
+records as raw bytes: the samples (little endian), the 16 plaintext bytes and
+the 16 ciphertext bytes.
+
+While the records arrive, the correlation sums are updated in a worker thread.
+At every interval the current best last round key, the ranking of every byte
+and a confidence are published, and the key is tested with test_key(). This
+does not wait for the next batch, so records before a pause of the capture are
+analysed in time. As soon as the key is right, the capture is stopped, i.e. the
+connection is closed.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+import numpy as np
+import instrument
+from checkpoint import write_atomic
+from aes.test_key import test_key
+from aes_dpa.accumulator import CorrelationAccumulator
+
+SOCKET = 'socket'
+PIPE = 'pipe'
+HDF5 = 'hdf5'
+SOURCES = (SOCKET, PIPE, HDF5)
+DEFAULT_SOCKET = 'dpa_live.sock'
+
+READ_BYTES = 1 << 20
+QUEUE_BATCHES = 64
+POLL_INTERVAL = 0.1
+# Seconds a growing HDF5 file may stay unchanged before its writer is considered gone, e.g. crashed
+IDLE_TIMEOUT = 60.0
+HDF5_SIGNATURE = b'\x89HDF\r\n\x1a\n'
+# File consistency flag of the superblock, set while a writer has the file open in SWMR mode
+SWMR_WRITE_ACCESS = 0x04
+# Number of hypotheses per byte in the published ranking
+TOP_CANDIDATES = 4
+
+
+def record_dtype(n_samples: int, dtype) -> np.dtype:
+    """The layout of one record on a socket or pipe."""
+    return np.dtype([('trace', np.dtype(dtype).newbyteorder('<'), (n_samples,)),
+                     ('plaintext', np.uint8, (16,)),
+                     ('ciphertext', np.uint8, (16,))])
+
+
+def encode_header(n_samples: int, dtype) -> bytes:
+    return (json.dumps({'samples': n_samples, 'dtype': np.dtype(dtype).name}) + '\n').encode()
+
+
+def encode_records(traces: np.ndarray, plaintexts: np.ndarray, ciphertexts: np.ndarray) -> bytes:
+    records = np.empty(len(traces), dtype=record_dtype(traces.shape[1], traces.dtype))
+    records['trace'] = traces
+    records['plaintext'] = plaintexts
+    records['ciphertext'] = ciphertexts
+    return records.tobytes()
+
+
+async def read_stream(stream: asyncio.StreamReader):
+    """Yield the batches of (traces, plaintexts, ciphertexts) of a stream, as many records as have arrived."""
+    header = json.loads(await stream.readline())
+    layout = record_dtype(header['samples'], header['dtype'])
+    buffer = b''
+    while True:
+        data = await stream.read(READ_BYTES)
+        if not data:
+            return
+        buffer += data
+        complete = len(buffer) // layout.itemsize * layout.itemsize
+        if complete:
+            records = np.frombuffer(buffer[:complete], dtype=layout)
+            buffer = buffer[complete:]
+            yield records['trace'], records['plaintext'], records['ciphertext']
+
+
+async def read_socket(path: str):
+    """Listen on a Unix socket and yield the batches of the first connection."""
+    connected = asyncio.get_running_loop().create_future()
+
+    def accept(reader, writer):
+        if connected.done():
+            writer.close()
+        else:
+            connected.set_result((reader, writer))
+
+    server = await asyncio.start_unix_server(accept, path)
+    print("Waiting for the capture on", path)
+    try:
+        reader, writer = await connected
+        try:
+            async for batch in read_stream(reader):
+                yield batch
+        finally:
+            writer.close()
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+async def read_pipe(path: str):
+    """Yield the batches of a named pipe, or of the standard input for '-'."""
+    loop = asyncio.get_running_loop()
+    file = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    reader = asyncio.StreamReader()
+    transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), file)
+    try:
+        async for batch in read_stream(reader):
+            yield batch
+    finally:
+        transport.close()
+
+
+def swmr_writing(path: str) -> bool:
+    """Whether a writer has an HDF5 file open in SWMR mode, by the file consistency flags of its superblock."""
+    with open(path, 'rb') as file:
+        # The superblock is at 0 or after a user block of 512, 1024, 2048... bytes
+        offset = 0
+        while True:
+            file.seek(offset)
+            superblock = file.read(12)
+            if len(superblock) < 12:
+                return False
+            if superblock[:8] == HDF5_SIGNATURE:
+                break
+            offset = offset * 2 if offset else 512
+    # Only superblock version 3 supports SWMR, the flags follow the version & the sizes of offsets & lengths
+    return superblock[8] >= 3 and bool(superblock[11] & SWMR_WRITE_ACCESS)
+
+
+def open_hdf5(path: str):
+    """Open a DPA dataset for reading while it grows."""
+    import h5py
+    try:
+        return h5py.File(path, 'r', libver='latest', swmr=True)
+    except OSError:
+        # Superblock too old for SWMR, never written in SWMR mode
+        return h5py.File(path, 'r')
+
+
+async def read_hdf5(path: str, idle_timeout: float = IDLE_TIMEOUT):
+    """Yield the new records of an HDF5 file whenever it has grown.
+
+    Ends when the file is complete, i.e. no writer has it open in SWMR mode
+    anymore, or when it has not grown for idle_timeout seconds (None to wait
+    for the writer forever).
+    """
+    while not os.path.exists(path):
+        await asyncio.sleep(POLL_INTERVAL)
+    file = await asyncio.to_thread(open_hdf5, path)
+    datasets = [file['traces'], file['plaintext'], file['ciphertext']]
+    position = 0
+    grown = time.monotonic()
+    try:
+        while True:
+            # Checked before the refresh, so the records written before closing the file are still read
+            growing = swmr_writing(path)
+            for dataset in datasets:
+                dataset.refresh()
+            # The ciphertexts are written last, a record is complete once all three are there
+            available = min(len(dataset) for dataset in datasets)
+            if available > position:
+                batch = await asyncio.to_thread(lambda: [dataset[position:available] for dataset in datasets])
+                position = available
+                grown = time.monotonic()
+                yield tuple(batch)
+            elif not growing or (idle_timeout is not None and time.monotonic() - grown > idle_timeout):
+                return
+            else:
+                await asyncio.sleep(POLL_INTERVAL)
+    finally:
+        file.close()
+
+
+def open_source(source: str, path: str, idle_timeout: float = IDLE_TIMEOUT):
+    if source == SOCKET:
+        return read_socket(path)
+    if source == PIPE:
+        return read_pipe(path)
+    if source == HDF5:
+        return read_hdf5(path, idle_timeout)
+    raise ValueError("Unknown source {}".format(source))
+
+
+class LiveDPA:
+    """Correlates the traces of a source while they arrive."""
+
+    def __init__(self, batches, interval: float = 1.0, max_traces: int = None, status_path: str = None) -> None:
+        """
+        Args:
+            batches: Async iterator over batches of (traces, plaintexts, ciphertexts), e.g. from open_source().
+            interval (float, optional): Time in seconds between two publications & key tests.
+            max_traces (int, optional): Stop after this many traces, even if the key is not found.
+            status_path (str, optional): JSON file the status is written to at every publication.
+        """
+        self.batches = batches
+        self.interval = interval
+        self.max_traces = max_traces
+        self.status_path = status_path
+        self.accumulator = None
+        self.pair = None
+        self.status = None
+
+    async def ingest(self, queue: asyncio.Queue):
+        """Put the batches into the queue, followed by None at the end or the error of the source."""
+        try:
+            async for batch in self.batches:
+                await queue.put(batch)
+        except Exception as error:
+            await queue.put(error)
+        else:
+            await queue.put(None)
+
+    async def receive(self, queue: asyncio.Queue) -> 'tuple(list, bool)':
+        """Wait for the next batch and take everything else that arrived in the meantime.
+
+        Returns:
+            tuple(list, bool): The batches and whether the source has ended.
+        """
+        items = [await queue.get()]
+        while not queue.empty() and items[-1] is not None:
+            items.append(queue.get_nowait())
+        for item in items:
+            if isinstance(item, Exception):
+                raise item
+        return [item for item in items if item is not None], items[-1] is None
+
+    def analyse(self) -> dict:
+        """Rank the hypotheses of every byte, test the best key and publish the status."""
+        peaks = self.accumulator.peaks()
+        ranking = np.argsort(-peaks, axis=1, kind='stable')
+        best = np.take_along_axis(peaks, ranking[:, :2], axis=1)
+        last_round_key = ranking[:, 0].astype(np.uint8)
+        success, key = test_key(last_round_key, *self.pair)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Relative distance of the best to the second best hypothesis
+            confidence = np.nan_to_num(1 - best[:, 1] / best[:, 0])
+        self.status = {
+            'traces': self.accumulator.n_traces,
+            'last_round_key': last_round_key.tobytes().hex().upper(),
+            'key': key,
+            'success': bool(success),
+            'confidence': confidence.round(4).tolist(),
+            'candidates': ranking[:, :TOP_CANDIDATES].tolist(),
+            'correlations': np.take_along_axis(peaks, ranking[:, :TOP_CANDIDATES], axis=1).round(4).tolist(),
+        }
+        self.publish()
+        return self.status
+
+    def publish(self):
+        print("{:>9} traces: {} confidence {:.3f}".format(
+            self.status['traces'], self.status['last_round_key'], min(self.status['confidence'])), end="\r")
+        if self.status_path:
+            write_atomic(self.status_path, lambda file: file.write(json.dumps(self.status).encode()))
+
+    async def run(self) -> dict:
+        """Correlate until the key is confirmed, the source ends or max_traces are reached.
+
+        Returns:
+            dict: The last status, see analyse(), None if no trace arrived.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(QUEUE_BATCHES)
+        ingestion = asyncio.create_task(self.ingest(queue))
+        published = time.monotonic()
+        analysed = 0
+        try:
+            while True:
+                # Wake up at the next publication even if no batch arrives until then
+                timeout = None if self.accumulator is None else max(0.0, published + self.interval - time.monotonic())
+                try:
+                    batches, finished = await asyncio.wait_for(self.receive(queue), timeout)
+                except asyncio.TimeoutError:
+                    batches, finished = [], False
+                if batches:
+                    traces, plaintexts, ciphertexts = (np.concatenate(parts) for parts in zip(*batches))
+                    if self.accumulator is None:
+                        self.accumulator = CorrelationAccumulator(traces.shape[1])
+                        self.pair = (plaintexts[0].copy(), ciphertexts[0].copy())
+                    if self.max_traces is not None:
+                        traces = traces[:self.max_traces - self.accumulator.n_traces]
+                        ciphertexts = ciphertexts[:len(traces)]
+                    with instrument.stage('live.accumulate'):
+                        await loop.run_in_executor(None, self.accumulator.add, traces, ciphertexts)
+                    instrument.count('live.traces', len(traces))
+                if self.accumulator is None:
+                    if finished:
+                        return None
+                    continue
+
+                finished = finished or (self.max_traces is not None and self.accumulator.n_traces >= self.max_traces)
+                if finished or time.monotonic() - published >= self.interval:
+                    if finished or self.accumulator.n_traces > analysed:
+                        with instrument.stage('live.analyse'):
+                            status = await loop.run_in_executor(None, self.analyse)
+                        analysed = self.accumulator.n_traces
+                        if status['success'] or finished:
+                            return status
+                    published = time.monotonic()
+        finally:
+            # Stops the capture, e.g. closes the connection
+            ingestion.cancel()
+            await asyncio.gather(ingestion, return_exceptions=True)
+            print("")
@@ -1,27 +1,58 @@
-import matplotlib.pyplot as plt  # Add support for drawing figures
-import reader as rd  # Loads traces
+"""
+Plots of power traces & DPA correlations.
+
+Long traces are reduced to a min/max envelope with two points per pixel
+column (see aes_dpa.decimate) before they are drawn, which looks the same as
+plotting every sample.
+The 256 lines of the key hypotheses are drawn as one LineCollection. When a
+plot is saved instead of shown, the headless Agg backend is used, so no
+window system is needed and figures can be rendered in worker processes.
+"""
+import concurrent.futures
+import multiprocessing
+import os
+import matplotlib
 import numpy as np
+import reader as rd  # Loads traces
+from aes_dpa.decimate import DPI, FIGURE_SIZE, decimate
+
+
+def pyplot(save: bool):
+    """Import pyplot, with the headless Agg backend when the plot is saved."""
+    if save:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def figure(plt):
+    return plt.figure(figsize=FIGURE_SIZE, dpi=DPI)
+
+
+def show_or_save(plt, filename: str, save: bool, block: bool = True):
+    if save:
+        plt.savefig(filename, format='png')
+        plt.close()
+    else:
+        plt.show(block=block)
+
 
-def plot_trace(input_path: str, save: bool):
+def plot_trace(input_path: str, save: bool, trace: np.ndarray = None):
     """
-    trace: The trace to plot
+    input_path: The traces, of which the first one is plotted
     save: optional; Set to True to save the plot on disk instead of showing in window
+    trace: optional; The trace to plot if it is already loaded, e.g. from the cache
     """
+    plt = pyplot(save)
     title='Power trace'
     filename='power_trace.png'
-    # Load measured traces into a matrix: trace-number x trace-length
-    reader = rd.DPAReader(input_path)
-    trace = reader.traces[0]
-    
-    if len(trace.shape) == 2:
-        num_samples = trace.shape[1]
-    else:
-        num_samples = len(trace)
+    # Only the first trace is plotted, don't load the whole dataset
+    if trace is None:
+        trace = rd.read_dpa_trace(input_path, 0)
+    num_samples = trace.shape[-1]
 
-
-        []
-    plt.figure()
-    plt.plot(trace, lw=.5)
+    figure(plt)
+    plt.plot(*decimate(trace), lw=.5)
     plt.xlabel('Samples')
     plt.xlim(0, num_samples)
     plt.ylabel('Power Consumption')
@@ -29,72 +60,107 @@ def plot_trace(input_path: str, save: bool):
         plt.ylim(0, 255)
     plt.grid('on')
     plt.title(title)
-    if save:
-        plt.savefig(filename, format='png')
-        plt.close()
-    else:
-        plt.show()
+    show_or_save(plt, filename, save)
 
 def plot_key_byte(kb, key, corr_vector, block=True, save=False):
     """
     kb: The key byte in range 0..15
     key: The value of the key byte (range: 0..255)
-    corr_vector: Correlations for key byte at sample points 
+    corr_vector: Correlations for key byte at sample points
         (length: #samples)
-    block: Set to False to avoid blocking the main thread. Be aware 
-        that you have to keep the main thread alive after you finished 
+    block: Set to False to avoid blocking the main thread. Be aware
+        that you have to keep the main thread alive after you finished
         all plots e.g. by calling the wait_for_plots() function in the very end.
         Also be patient, loading all plots may take some time
     save: optional; Set to True to save the plot on disk instead of showing in window
     """
+    plt = pyplot(save)
     # Plot correlation for given key byte
-    plt.figure()
+    figure(plt)
     plt.xlabel('Samples')
     plt.xlim(0, len(corr_vector))
     plt.ylabel('Correlation')
     plt.ylim(-1, 1)
     plt.grid('on')
     plt.title('Correlation for key byte {} (key = 0x{:02X})'.format(kb, key))
-    plt.plot(corr_vector, lw=.5)
-    if save:
-        plt.savefig('key_byte_{}.png'.format(kb), format='png')
-        plt.close()
-    else:
-        plt.show(block=block)
+    plt.plot(*decimate(corr_vector), lw=.5)
+    show_or_save(plt, 'key_byte_{}.png'.format(kb), save, block)
 
 
-def plot_key_hypothesis(kb, corr_matrix, key=None, block=True, save=False):
+def plot_key_hypothesis(kb, corr_matrix, key=None, block=True, save=False, num_samples=None, samples=None):
     """
     kb: The key byte in range 0..15
-    corr_matrix: Correlations for key hypothesis at sample points 
+    corr_matrix: Correlations for key hypothesis at sample points
         (dimension: #hypothesis x #samples)
     key: The correct key for visual highlighting
-    block: Set to False to avoid blocking the main thread. Be aware 
-        that you have to keep the main thread alive after you finished 
+    block: Set to False to avoid blocking the main thread. Be aware
+        that you have to keep the main thread alive after you finished
         all plots e.g. by calling the wait_for_plots() function in the very end.
         Also be patient, loading all plots may take some time
     save: optional; Set to True to save the plot on disk instead of showing in window
+    num_samples, samples: optional; For an already decimated corr_matrix, the number of
+        samples of the traces and the sample index of every column as returned by decimate()
     """
+    from matplotlib.collections import LineCollection
+    plt = pyplot(save)
+    if samples is None:
+        num_samples = corr_matrix.shape[1]
+        samples, corr_matrix = decimate(corr_matrix)
+    # All hypotheses as one collection of lines, shape (#hypothesis, #points, 2)
+    segments = np.empty(corr_matrix.shape + (2,))
+    segments[..., 0] = samples
+    segments[..., 1] = corr_matrix
+
     # Plot correlation for all key hypothesis
-    plt.figure()
+    figure(plt)
     plt.xlabel('Samples')
-    plt.xlim(0, corr_matrix.shape[1])
+    plt.xlim(0, num_samples)
     plt.ylabel('Correlation')
     plt.ylim(-1, 1)
     plt.grid('on')
     plt.title('Correlation for key byte {}'.format(kb))
-    if key != None:
-        for i in range(corr_matrix.shape[0]):
-            plt.plot(corr_matrix[i], '#CCCCCC', lw=.5)
-        plt.plot(corr_matrix[key], '#000000', lw=.5)
+    axes = plt.gca()
+    if key is not None:
+        axes.add_collection(LineCollection(segments, colors='#CCCCCC', linewidths=.5))
+        plt.plot(samples, corr_matrix[key], '#000000', lw=.5)
     else:
-        for i in range(corr_matrix.shape[0]):
-            plt.plot(corr_matrix[i], lw=.5)
-    if save:
-        plt.savefig('key_hypothesis_{}.png'.format(kb), format='png')
-        plt.close()
-    else:
-        plt.show(block=block)
+        colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+        axes.add_collection(LineCollection(segments, colors=colors, linewidths=.5))
+    show_or_save(plt, 'key_hypothesis_{}.png'.format(kb), save, block)
+
+
+def save_key_hypothesis(kb, corr_matrix, key, num_samples, samples):
+    """Render one figure of plot_key_hypothesis() to its file, runs in a worker process."""
+    plot_key_hypothesis(kb, corr_matrix, key, save=True, num_samples=num_samples, samples=samples)
+    return 'key_hypothesis_{}.png'.format(kb)
+
+
+def save_key_hypotheses(corr_matrices, key=None, workers=None) -> 'list[str]':
+    """
+    Save the figures of plot_key_hypothesis() of all key bytes in parallel.
+
+    corr_matrices: Correlations for key hypothesis at sample points of every key byte
+        (dimension: #bytes x #hypothesis x #samples), or a list of (num_samples, samples, corr_matrix)
+        of already decimated correlations
+    key: optional; The correct key bytes for visual highlighting
+    workers: optional; Number of worker processes, one per CPU by default
+    Returns the file names
+    """
+    figures = []
+    for kb, corr_matrix in enumerate(corr_matrices):
+        if isinstance(corr_matrix, tuple):
+            num_samples, samples, corr_matrix = corr_matrix
+        else:
+            num_samples = corr_matrix.shape[1]
+            # Decimate here, so only the envelopes are sent to the workers
+            samples, corr_matrix = decimate(corr_matrix)
+        figures.append((kb, corr_matrix, None if key is None else int(key[kb]), num_samples, samples))
+
+    # Fresh worker processes, a forked interactive backend would not work
+    context = multiprocessing.get_context('spawn')
+    workers = workers or min(len(figures), os.cpu_count())
+    with concurrent.futures.ProcessPoolExecutor(workers, mp_context=context) as pool:
+        return list(pool.map(save_key_hypothesis, *zip(*figures)))
 
 
 def plot_max_correlation(num_traces, max_corr, key=None, save=False, byte=0):
@@ -106,11 +172,13 @@ def plot_max_correlation(num_traces, max_corr, key=None, save=False, byte=0):
     save: optional; Set to True to save the plot on disk instead of showing in window
     byte: number of the byte (for the filename only)
     """
+    from matplotlib.collections import LineCollection
+    plt = pyplot(save)
     # Use absolute values for max correlation
     max_corr = np.absolute(max_corr)
 
     # Plot correlation for all key hypothesis
-    plt.figure()
+    figure(plt)
     plt.xlabel('Number of traces')
     plt.xlim(num_traces[0], num_traces[-1])
     plt.ylabel('Max-Abs Correlation')
@@ -119,18 +187,17 @@ def plot_max_correlation(num_traces, max_corr, key=None, save=False, byte=0):
     plt.title('Key byte {}'.format(byte))
     if key == None:
         key = np.argmax(max_corr[-1, :])
-    for i in range(max_corr.shape[1]):
-        plt.plot(num_traces, max_corr[:, i], '#CCCCCC', lw=.5)
+    segments = np.empty((max_corr.shape[1], max_corr.shape[0], 2))
+    segments[..., 0] = num_traces
+    segments[..., 1] = max_corr.T
+    plt.gca().add_collection(LineCollection(segments, colors='#CCCCCC', linewidths=.5))
     plt.plot(num_traces, max_corr[:, key], '#000000', lw=1)
-    if save:
-        plt.savefig('max_correlation_%.2i.png' % byte, format='png')
-        plt.close()
-    else:
-        plt.show()
+    show_or_save(plt, 'max_correlation_%.2i.png' % byte, save)
 
 def wait_for_plots():
     """
-    Use this method in conjunction with the other print functions when 'block=False' 
+    Use this method in conjunction with the other print functions when 'block=False'
     to block the main thread in the end for interactivity with the plots.
     """
+    import matplotlib.pyplot as plt
     plt.show()
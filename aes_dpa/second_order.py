@@ -0,0 +1,55 @@
+"""
+Combining functions of the second-order DPA on masked AES.
+
+A masked implementation never handles a state byte v itself, only its shares,
+e.g. a random mask m and v ^ m, which leak at two different samples. Each
+share alone is independent of v, but a combination of both samples, e.g. the
+product of the centred samples, depends on the Hamming weight of v. So the
+combined samples are correlated with the last round model like the samples of
+the first-order DPA.
+
+All pairs of samples within a window are combined, W * (W - 1) / 2 pairs for
+W samples. They are correlated in blocks of pairs, and the traces of a block
+chunk by chunk, so only the correlation sums of one block are in memory.
+"""
+import numpy as np
+
+PRODUCT = 'product'
+ABSOLUTE_DIFFERENCE = 'absdiff'
+COMBINATIONS = (PRODUCT, ABSOLUTE_DIFFERENCE)
+# Sample pairs correlated at once, the sums of a block take 16 * 256 * 8 bytes per pair
+PAIR_BLOCK = 2048
+
+
+def sample_pairs(window_size: int) -> 'tuple(np.ndarray, np.ndarray)':
+    """All pairs of different samples of a window.
+
+    Returns:
+        tuple(np.ndarray, np.ndarray): The first & the second sample of every pair, relative to the window.
+    """
+    return np.triu_indices(window_size, 1)
+
+
+def combine(traces: np.ndarray, first: np.ndarray, second: np.ndarray, combination: str = PRODUCT,
+            means: np.ndarray = None, dtype=np.float64) -> np.ndarray:
+    """Combine pairs of samples of the traces.
+
+    Args:
+        traces (np.ndarray): The samples of the window, traces x samples.
+        first (np.ndarray): The first sample of every pair.
+        second (np.ndarray): The second sample of every pair.
+        combination (str, optional): PRODUCT of the centred samples or ABSOLUTE_DIFFERENCE.
+        means (np.ndarray, optional): The means of the samples over all traces, needed for PRODUCT.
+        dtype (optional): The type of the combined samples.
+
+    Returns:
+        np.ndarray: The combined samples, traces x pairs.
+    """
+    if combination == PRODUCT:
+        centred = traces.astype(dtype)
+        centred -= means.astype(dtype)
+        return centred[:, first] * centred[:, second]
+    if combination == ABSOLUTE_DIFFERENCE:
+        samples = traces.astype(dtype)
+        return np.absolute(samples[:, first] - samples[:, second])
+    raise ValueError("Unknown combination {}.".format(combination))
@@ -1,119 +1,453 @@
 import time
 import argparse
+import json
 from os import path
-import copy
-from aes.test_key import test_key
-
-# DTA
-from rsa_dta import dta
-
-# DPA
-from aes_dpa import dpa
-from aes_dpa.plot import plot_trace
-
-# DFA
-from aes_dfa import dfa
+import instrument
 
 DTA_STR = 'dta'
 DPA_STR = 'dpa'
 DFA_STR = 'dfa'
+DPA_LIVE_STR = 'dpa-live'
 
+DTA_CORRECT_KEY_FILE = 'correct_key.txt'
+DEFAULT_CACHE_DIRECTORY = '.attack_cache'
+DEFAULT_CACHE_SIZE_MB = 1024.0
+DEFAULT_CHECKPOINT_INTERVAL = 60.0
+# The options of checkpoints & the cache with their defaults, rejected by attacks without support for them
+STATE_OPTIONS = {'checkpoint': None, 'resume': False, 'checkpoint_interval': DEFAULT_CHECKPOINT_INTERVAL,
+                 'cache': False, 'cache_dir': DEFAULT_CACHE_DIRECTORY, 'cache_size': DEFAULT_CACHE_SIZE_MB}
 
-if __name__ == '__main__':
-    description = """
-A python script to perform some very basic physical attacks. There are 3 attacks implemented:
-    - Differential Timing Attack (DTA) on RSA
-    - Differential Power Analysis (DPA) on AES
-    - Differential Fault Attack (DFA) on AES
-    
-Chose an attack and either provide your own input data, or use the provided example data.
+#####################################################################
+# Registry ##########################################################
+#####################################################################
+
+# Attack name -> Attack. The modules of an attack & their dependencies,
+# e.g. h5py or matplotlib, are only imported when it is run.
+ATTACKS = {}
+
+
+class Attack:
+    """A subcommand of this script.
+
+    run(args) performs the attack, prints the results & returns them as dict
+    with the recovered key, whether it is correct and the attack time.
     """
-    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawTextHelpFormatter)
-    
-    parser.add_argument('attack',
-                        type=str,
-                        choices=[DTA_STR, DPA_STR, DFA_STR],
-                        help='The attack to perform. Choose from: dta, dpa, dfa')
-    
-    parser.add_argument('--input',
-                        type=str,
-                        help=   'Path to an input folder containing, e.g. traces for DPA. ' +
-                                'Check the README for more information on, e.g. file names.')
-    
-    parser.add_argument('--plot-dpa',
-                        action='store_true',
-                        help='Whether to plot the power traces for DPA.')
 
-    parser.add_argument('--save-plot',
-                        action='store_true',
-                        help='Whether to save the DPA plot.')
-    
-    args = parser.parse_args()
-    
-    if args.input and not path.exists(args.input):
-        print("You need to provide a valid path to the input data.")
-        quit()
-    attack: str = args.attack
-    input_path: str = args.input
-    plot_dpa = args.plot_dpa
-    save_plot = args.save_plot
-    if save_plot and not plot_dpa:
-        plot_dpa = True
-    
-    ############################### PERFORM DTA ####################################
-    if attack == DTA_STR:
-        dta_runner = dta.DTA(input_path)
-        start = time.time()
-        key = dta_runner.perform_timing_attack()
-        consumed = time.time() - start
+    def __init__(self, name: str, help: str, run, arguments: 'list[tuple]', input_exists: bool = True,
+                 stateful: bool = True) -> None:
+        self.name = name
+        self.help = help
+        self.run = run
+        self.arguments = arguments
+        # Whether --input has to exist before the attack starts
+        self.input_exists = input_exists
+        # Whether the attack supports checkpoints & the cache, see STATE_OPTIONS
+        self.stateful = stateful
 
-        # TEST RESULTS
-        keyhex = ",".join(["%02X" % (key >> 64 - (8 * (i + 1)) & 0x00000000000000FF) for i in range(8)])
-        with open("rsa_dta/input_files/correct_key.txt", "r") as sol:
+    def add_parser(self, subparsers, parents: list):
+        parser = subparsers.add_parser(self.name, help=self.help, description=self.help, parents=parents)
+        for flags, options in self.arguments:
+            parser.add_argument(*flags, **options)
+        parser.set_defaults(attack=self.name)
+        return parser
+
+
+def register(name: str, help: str, arguments: 'list[tuple]' = (), input_exists: bool = True, stateful: bool = True):
+    """Register the decorated function as subcommand name.
+
+    Args:
+        name (str): The name of the subcommand.
+        help (str): The help text of the subcommand.
+        arguments (list[tuple], optional): The (flags, options) for add_argument() of the subcommand's own options.
+        input_exists (bool, optional): Whether --input has to exist before the attack starts.
+        stateful (bool, optional): Whether the attack supports checkpoints & the cache.
+    """
+    def decorator(run):
+        ATTACKS[name] = Attack(name, help, run, list(arguments), input_exists, stateful)
+        return run
+    return decorator
+
+
+def argument(*flags, **options) -> tuple:
+    return flags, options
+
+
+def open_checkpoint(args, input_path: str):
+    """The checkpoint of the run if --checkpoint or --resume is given, None otherwise."""
+    if not (args.checkpoint or args.resume):
+        return None
+    import checkpoint as cp
+    fingerprint = cp.fingerprint(args.attack, input_path)
+    checkpoint_path = args.checkpoint or cp.default_path(args.attack, fingerprint)
+    checkpoint = cp.Checkpoint(checkpoint_path, fingerprint, args.checkpoint_interval, args.resume)
+    if checkpoint.resumed:
+        print("Resuming from checkpoint", checkpoint_path)
+    elif checkpoint.stale:
+        print("Checkpoint {} belongs to another attack or input, starting from the beginning.".format(checkpoint_path))
+    elif args.resume:
+        print("No checkpoint {} found, starting from the beginning.".format(checkpoint_path))
+    return checkpoint
+
+
+def close_checkpoint(checkpoint, success: bool):
+    """Delete the checkpoint of a successful attack, otherwise write its final state."""
+    if checkpoint is None:
+        return
+    if success:
+        checkpoint.remove()
+    else:
+        checkpoint.write()
+
+
+def open_cache(args, input_path: str, **params):
+    """The cache entry of the run if --cache is given, None otherwise."""
+    if not args.cache:
+        return None
+    import cache as cc
+    return cc.Cache(args.cache_dir, args.cache_size).entry(args.attack, input_path, **params)
+
+
+def cached_result(cache) -> dict:
+    """Print & return the result of an earlier run stored in the cache."""
+    result = dict(cache.result, cached=True)
+    print("Result of an earlier run on the same data, cached in", cache.path)
+    print("Key:", result['key'], "(correct)" if result['success'] else "(wrong)")
+    return result
+
+#####################################################################
+# Attacks ###########################################################
+#####################################################################
+
+@register(DTA_STR, 'Differential Timing Attack (DTA) on RSA')
+def run_dta(args):
+    from rsa_dta import dta
+    import reader as rd
+
+    cache = open_cache(args, args.input or rd.DEFAULT_DTA_INPUT_PATH)
+    if cache is not None and cache.result is not None:
+        return cached_result(cache)
+    with instrument.stage('dta.load'):
+        dta_runner = dta.DTA(args.input)
+    start = time.time()
+    checkpoint = open_checkpoint(args, dta_runner.reader.input_path)
+    with instrument.stage('dta.attack'):
+        key = dta_runner.perform_timing_attack(checkpoint, cache)
+    consumed = time.time() - start
+
+    # TEST RESULTS
+    key_bytes = (dta_runner.reader.key_bits + 7) // 8
+    keyhex = ",".join(["%02X" % (key >> 8 * (key_bytes - i - 1) & 0xFF) for i in range(key_bytes)])
+    solution = path.join(dta_runner.reader.input_path, DTA_CORRECT_KEY_FILE)
+    if path.exists(solution):
+        with open(solution, "r") as sol:
             expected = sol.read()
-            if expected == keyhex:
-                print("Congratulations! Your attack works")
-                result = True
-            else:
-                print(":( Your attack is not working yet. Keep on trying!")
-                print("Expected:", expected)
-        print("Your key:", keyhex)
-        print("Attack time [s]: {:.3f}".format(consumed))
-    
-    ############################### PERFORM DPA ####################################
-    if attack == DPA_STR:
-        dpa_runner = dpa.DPA(input_path)
+    else:
+        # perform_timing_attack() already verified the key with the testing pair
+        expected = keyhex
+    if expected == keyhex:
+        print("Congratulations! Your attack works")
+    else:
+        print(":( Your attack is not working yet. Keep on trying!")
+        print("Expected:", expected)
+    print("Your key:", keyhex)
+    print("Attack time [s]: {:.3f}".format(consumed))
+    result = {'key': keyhex, 'success': expected == keyhex, 'attack_time_s': consumed}
+    close_checkpoint(checkpoint, result['success'])
+    if cache is not None:
+        cache.store_result(result)
+    return result
+
+
+@register(DPA_STR, 'Differential Power Analysis (DPA) on AES', arguments=[
+    argument('--plot-dpa', action='store_true', help='Whether to plot the power traces for DPA.'),
+    argument('--save-plot', action='store_true', help='Whether to save the DPA plot.'),
+    argument('--plot-hypotheses', action='store_true',
+             help='Save the correlations of all key hypotheses as key_hypothesis_<byte>.png, rendered in parallel.'),
+    argument('--precision', choices=['float64', 'float32'], default='float64',
+             help='Working precision of the correlation, float32 keeps 8 bit traces as they are stored '
+                  'and needs about half the memory.'),
+    argument('--chunk-traces', type=int,
+             help='Correlate the traces in chunks of this many traces instead of loading all of them.'),
+    argument('--prefetch', type=int, default=2,
+             help='Number of chunks read ahead in a background thread while a chunk is correlated, '
+                  '0 reads every chunk when it is needed.'),
+    argument('--order', type=int, choices=[1, 2], default=1,
+             help='1: correlate single samples. 2: second-order DPA on masked implementations, '
+                  'correlating combined pairs of samples in --window.'),
+    argument('--window', type=int, nargs=2, metavar=('START', 'STOP'),
+             help='The samples START to STOP - 1, all pairs of which are combined by the second-order DPA.'),
+    argument('--combination', choices=['product', 'absdiff'], default='product',
+             help='How the second-order DPA combines 2 samples: product of the centred samples or '
+                  'absolute difference.'),
+    argument('--pair-block', type=int, default=2048,
+             help='Number of sample pairs the second-order DPA correlates at once.'),
+])
+def run_dpa(args):
+    from aes_dpa import dpa
+    from aes.test_key import test_key
+    import reader as rd
+
+    if args.order == 2 and args.window is None:
+        raise ValueError("The second-order DPA needs a --window")
+    if args.order == 2 and args.plot_hypotheses:
+        raise ValueError("--plot-hypotheses is only supported by the first-order DPA")
+    input_path = args.input or rd.DEFAULT_DPA_TRACES_PATH
+    params = {'precision': args.precision}
+    if args.order == 2:
+        params.update(order=2, window=args.window, combination=args.combination)
+    cache = open_cache(args, input_path, **params)
+    cached = cache is not None and cache.result is not None
+    correlations = None
+    if cached and args.plot_hypotheses:
+        correlations = dpa.cached_correlations(cache)
+        # The missing correlations are computed again, the cached ones are reused
+        cached = correlations is not None
+    if cached:
+        # Neither the traces are loaded nor the correlations computed again
+        output = cached_result(cache)
+    else:
+        with instrument.stage('dpa.load'):
+            dpa_runner = dpa.DPA(args.input, args.precision, args.chunk_traces, args.prefetch)
+        checkpoint = open_checkpoint(args, dpa_runner.reader.input_path)
         t = time.perf_counter()
-        last_round_key = dpa_runner.perform_dpa()
+        with instrument.stage('dpa.attack'):
+            if args.order == 2:
+                last_round_key = dpa_runner.perform_second_order_dpa(args.window, args.combination, args.pair_block,
+                                                                     checkpoint)
+            else:
+                last_round_key = dpa_runner.perform_dpa(args.plot_hypotheses, checkpoint, cache)
         consumed = time.perf_counter() - t
 
         # TEST RESULTS
-        result, key = test_key(last_round_key, dpa_runner.reader.plaintexts[0], dpa_runner.reader.ciphertexts[0])
-        if result:    
+        with instrument.stage('dpa.verify'):
+            result, key = test_key(last_round_key, dpa_runner.reader.plaintexts[0], dpa_runner.reader.ciphertexts[0])
+        close_checkpoint(checkpoint, result)
+        if result:
             print(f"Congratulations! Your key {key} is right.")
         else:
             print("Your key is wrong, AES is too strong. Just go on, it won't take that long")
         print("Attack time [s]: {:.3f}".format(consumed))
-        
-        if plot_dpa:
-            plot_trace(input_path, save_plot)
-            
-    ############################### PERFORM DFA ####################################
-    if attack == DFA_STR:
-        dfa_runner = dfa.DFA(input_path)
-        # Save one cipher/plaintext pair in case the input lists get modified inplace
-        test_plain = copy.copy(dfa_runner.reader.plaintexts[0])
-        test_cipher = copy.copy(dfa_runner.reader.ciphertexts[0])
-        
-        t = time.perf_counter()
-        last_round_key = dfa_runner.perform_dfa()
-        consumed = time.perf_counter() - t
+        output = {'key': key, 'last_round_key': bytes(int(b) for b in last_round_key).hex().upper(),
+                  'success': result, 'attack_time_s': consumed}
+        correlations = dpa_runner.correlations if args.plot_hypotheses else None
+        if cache is not None:
+            cache.store_result(output)
 
-        # TEST RESULTS
+    if args.plot_dpa or args.save_plot:
+        from aes_dpa.plot import plot_trace
+        with instrument.stage('dpa.plot'):
+            trace = cache.get('trace') if cache is not None else None
+            if trace is None:
+                trace = rd.read_dpa_trace(input_path, 0)
+                if cache is not None:
+                    cache.put('trace', trace)
+            plot_trace(input_path, args.save_plot, trace)
+    if args.plot_hypotheses:
+        from aes_dpa.plot import save_key_hypotheses
+        with instrument.stage('dpa.plot_hypotheses'):
+            files = save_key_hypotheses(correlations, bytes.fromhex(output['last_round_key']))
+        print("Correlations of the key hypotheses saved to {} ... {}".format(files[0], files[-1]))
+    return output
+
+
+@register(DFA_STR, 'Differential Fault Attack (DFA) on AES')
+def run_dfa(args):
+    from aes_dfa import dfa
+    from aes.test_key import test_key
+    import reader as rd
+
+    cache = open_cache(args, args.input or rd.DEFAULT_DFA_INPUT_PATH)
+    if cache is not None and cache.result is not None:
+        return cached_result(cache)
+    with instrument.stage('dfa.load'):
+        dfa_runner = dfa.DFA(args.input)
+
+    checkpoint = open_checkpoint(args, dfa_runner.reader.input_path)
+    t = time.perf_counter()
+    with instrument.stage('dfa.attack'):
+        last_round_key = dfa_runner.perform_dfa(checkpoint, cache)
+    consumed = time.perf_counter() - t
+
+    # TEST RESULTS
+    with instrument.stage('dfa.verify'):
         result, key = test_key(last_round_key, dfa_runner.reader.plaintexts[0], dfa_runner.reader.ciphertexts[0])
-        if result:
-            print("Congratulations! Your key is correct.")
-        else:
-            print("Not only the ciphertexts are faulty, your key is too.")
-        print("Key guess: " + key)
-        print("Attack time [s]: {:.3f}".format(consumed))
+    close_checkpoint(checkpoint, result)
+    if result:
+        print("Congratulations! Your key is correct.")
+    else:
+        print("Not only the ciphertexts are faulty, your key is too.")
+    print("Key guess: " + str(key))
+    print("Attack time [s]: {:.3f}".format(consumed))
+    result = {'key': key, 'last_round_key': bytes(int(b) for b in last_round_key).hex().upper(),
+              'success': result, 'attack_time_s': consumed}
+    if cache is not None:
+        cache.store_result(result)
+    return result
+
+
+@register(DPA_LIVE_STR, 'Live DPA on AES, correlating traces while they are captured', input_exists=False,
+          stateful=False, arguments=[
+    argument('--source', choices=['socket', 'pipe', 'hdf5'], default='socket',
+             help='Where the traces come from: a Unix socket listened on at --input (default dpa_live.sock), '
+                  'a named pipe at --input (default: standard input) or a growing HDF5 file at --input.'),
+    argument('--interval', type=float, default=1.0,
+             help='Seconds between two publications of the current key, which is tested every time.'),
+    argument('--max-traces', type=int, help='Stop after this many traces, even if the key is not found.'),
+    argument('--status', type=str, help='JSON file the current key, ranking & confidence are written to.'),
+    argument('--idle-timeout', type=float, default=60.0,
+             help='Stop when a growing HDF5 file has not grown for this many seconds although its writer still '
+                  'has it open, e.g. after a crash. A closed file ends the attack right away.'),
+])
+def run_dpa_live(args):
+    import asyncio
+    from aes_dpa import live
+
+    if args.input:
+        source_path = args.input
+    elif args.source == live.HDF5:
+        raise ValueError("The hdf5 source needs an --input file")
+    else:
+        source_path = live.DEFAULT_SOCKET if args.source == live.SOCKET else '-'
+    batches = live.open_source(args.source, source_path, args.idle_timeout)
+    t = time.perf_counter()
+    with instrument.stage('dpa_live.attack'):
+        status = asyncio.run(live.LiveDPA(batches, args.interval, args.max_traces, args.status).run())
+    consumed = time.perf_counter() - t
+
+    if status is None:
+        print("No traces received.")
+        return {'key': None, 'success': False, 'traces': 0, 'attack_time_s': consumed}
+    if status['success']:
+        print("Congratulations! Your key {} is right, found with {} traces.".format(status['key'], status['traces']))
+    else:
+        print("The key is not found yet, the last round key {} is wrong.".format(status['last_round_key']))
+    print("Attack time [s]: {:.3f}".format(consumed))
+    return {'key': status['key'], 'last_round_key': status['last_round_key'], 'success': status['success'],
+            'traces': status['traces'], 'attack_time_s': consumed}
+
+
+def common_parser(after_attack: bool = False) -> argparse.ArgumentParser:
+    """The options of all attacks, which can be given before or after the attack.
+
+    Args:
+        after_attack (bool, optional): For the parser of an attack. Its options have no defaults,
+            so they don't overwrite the options given before the attack.
+    """
+    common = argparse.ArgumentParser(add_help=False,
+                                     argument_default=argparse.SUPPRESS if after_attack else None)
+
+    def default(value):
+        return argparse.SUPPRESS if after_attack else value
+
+    common.add_argument('--input',
+                        type=str,
+                        help=   'Path to an input folder containing, e.g. traces for DPA. ' +
+                                'Check the README for more information on, e.g. file names.')
+
+    common.add_argument('--profile',
+                        action='store_true',
+                        help='Print time, calls & peak memory of every stage of the attack.')
+
+    common.add_argument('--report',
+                        type=str,
+                        help='Write the stage measurements as JSON to this file. Implies --profile.')
+
+    common.add_argument('--cprofile',
+                        type=str,
+                        help='Profile the run with cProfile and write the statistics to this file. Implies --profile.')
+
+    common.add_argument('--checkpoint',
+                        type=str,
+                        help='Save the progress of the attack to this file, see --resume.')
+
+    common.add_argument('--resume',
+                        action='store_true',
+                        default=default(None),
+                        help='Continue an interrupted attack from its checkpoint, by default checkpoint_<attack>_<hash>.npz.')
+
+    common.add_argument('--cache',
+                        action='store_true',
+                        default=default(None),
+                        help='Reuse the results & intermediates of earlier runs on the same data, see --cache-dir.')
+
+    common.add_argument('--cache-dir',
+                        type=str,
+                        default=default(None),
+                        help='The folder of the cache (default {}).'.format(DEFAULT_CACHE_DIRECTORY))
+
+    common.add_argument('--cache-size',
+                        type=float,
+                        default=default(None),
+                        help='Maximum size of the cache in MiB, the least recently used entries are removed '
+                             '(default {:g}).'.format(DEFAULT_CACHE_SIZE_MB))
+
+    common.add_argument('--checkpoint-interval',
+                        type=float,
+                        default=default(None),
+                        help='Minimum time in seconds between two checkpoints (default {:g}).'.format(
+                            DEFAULT_CHECKPOINT_INTERVAL))
+
+    return common
+
+
+def build_parser() -> argparse.ArgumentParser:
+    description = """
+A python script to perform some very basic physical attacks. There are 3 attacks implemented:
+    - Differential Timing Attack (DTA) on RSA
+    - Differential Power Analysis (DPA) on AES
+    - Differential Fault Attack (DFA) on AES
+The DPA also has a live mode (dpa-live), which correlates the traces while they are captured.
+
+Chose an attack and either provide your own input data, or use the provided example data.
+Run 'attacks.py <attack> --help' for the options of an attack. The options of all attacks, e.g. --input,
+can be given before or after the attack.
+    """
+    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawTextHelpFormatter,
+                                     parents=[common_parser()])
+    subparsers = parser.add_subparsers(title='attacks', metavar='attack', required=True,
+                                       help='The attack to perform. Choose from: ' + ', '.join(ATTACKS))
+    for attack in ATTACKS.values():
+        attack.add_parser(subparsers, [common_parser(after_attack=True)])
+    return parser
+
+
+def parse_args(argv: 'list[str]' = None) -> argparse.Namespace:
+    """Parse the command line, the options of checkpoints & the cache are rejected for attacks without them."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    given = ['--' + dest.replace('_', '-') for dest in STATE_OPTIONS if getattr(args, dest) is not None]
+    if given and not ATTACKS[args.attack].stateful:
+        parser.error("{} does not support {}".format(args.attack, ', '.join(given)))
+    for dest, value in STATE_OPTIONS.items():
+        if getattr(args, dest) is None:
+            setattr(args, dest, value)
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    if args.input and ATTACKS[args.attack].input_exists and not path.exists(args.input):
+        print("You need to provide a valid path to the input data.")
+        quit()
+    recorder = None
+    if args.profile or args.report or args.cprofile:
+        recorder = instrument.enable(memory=True, profile=bool(args.cprofile))
+
+    ATTACKS[args.attack].run(args)
+
+    ############################### REPORT #########################################
+    if recorder:
+        instrument.disable()
+        report = recorder.report()
+        print("")
+        print(instrument.summary(report))
+        if args.report:
+            report['attack'] = args.attack
+            report['input'] = args.input
+            with open(args.report, 'w') as file:
+                json.dump(report, file, indent=2)
+            print("Report written to", args.report)
+        if args.cprofile:
+            recorder.dump_profile(args.cprofile)
+            print("cProfile statistics written to", args.cprofile)
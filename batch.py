@@ -0,0 +1,190 @@
+"""
+Run attacks on many datasets with a pool of worker processes.
+
+The jobs are read from a manifest or found in a directory. Every finished job
+is appended as one JSON line to the results file, so an interrupted campaign
+continues where it stopped when the same command is run again.
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import datetime
+import json
+import os
+import time
+
+import reader as rd
+from attacks import ATTACKS, DTA_STR, DPA_STR, DFA_STR, build_parser, parse_args
+
+DEFAULT_RESULTS = 'batch_results.jsonl'
+DPA_EXTENSIONS = ('.h5', '.hdf5')
+DFA_EXTENSIONS = ('.csv', rd.DFA_BINARY_EXTENSION)
+
+DONE = 'done'
+ERROR = 'error'
+
+
+def job_id(attack: str, input_path: str, options: 'list[str]') -> str:
+    return ' '.join([attack, os.path.abspath(input_path)] + options)
+
+
+def make_job(attack: str, input_path: str, options: 'list[str]' = (), id: str = None) -> dict:
+    """Create a job and check its attack, input & options."""
+    options = list(options)
+    if attack not in ATTACKS:
+        raise ValueError("Unknown attack {} for {}".format(attack, input_path))
+    if not os.path.exists(input_path):
+        raise ValueError("Input {} does not exist".format(input_path))
+    # Fail early for invalid options, instead of in a worker
+    _, unknown = build_parser().parse_known_args([attack, '--input', input_path] + options)
+    if unknown:
+        raise ValueError("Unknown options {} for {} {}".format(' '.join(unknown), attack, input_path))
+    return {'id': id or job_id(attack, input_path, options), 'attack': attack,
+            'input': input_path, 'options': options}
+
+
+def read_manifest(path: str) -> 'list[dict]':
+    """Read the jobs of a manifest.
+
+    Every line is a JSON object with the attack, the input path relative to
+    the manifest and optionally a list of options & an id, e.g.
+    {"attack": "dpa", "input": "device_3/traces.h5", "options": ["--plot-dpa", "--save-plot"]}
+    """
+    jobs = []
+    directory = os.path.dirname(os.path.abspath(path))
+    with open(path, 'r') as file:
+        for line in file:
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            entry = json.loads(line)
+            jobs.append(make_job(entry['attack'], os.path.join(directory, entry['input']),
+                                 entry.get('options', []), entry.get('id')))
+    return jobs
+
+
+def scan_directory(path: str, options: 'list[str]') -> 'list[dict]':
+    """Find datasets in a directory tree.
+
+    HDF5 files are attacked with the DPA, CSV & .npy files with the DFA and
+    folders containing the DTA timings with the DTA.
+    """
+    jobs = []
+    for root, directories, files in os.walk(path):
+        directories.sort()
+        if rd.DTA_TIMING_FILE in files:
+            jobs.append(make_job(DTA_STR, root, options))
+            continue
+        for name in sorted(files):
+            extension = os.path.splitext(name)[1].lower()
+            if extension in DPA_EXTENSIONS:
+                jobs.append(make_job(DPA_STR, os.path.join(root, name), options))
+            elif extension in DFA_EXTENSIONS:
+                jobs.append(make_job(DFA_STR, os.path.join(root, name), options))
+    return jobs
+
+
+def read_results(path: str) -> 'dict[str, dict]':
+    """Read the results of previous runs, the last result of a job wins."""
+    results = {}
+    if os.path.exists(path):
+        with open(path, 'r') as file:
+            for line in file:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    # Line cut off by an interruption
+                    continue
+                results[result['id']] = result
+    return results
+
+
+def run_job(job: dict, memory: bool) -> dict:
+    """Run one job in a worker process.
+
+    The modules of the attacks stay imported in the worker, so only the
+    dataset is loaded per job.
+    """
+    import instrument
+    args = parse_args([job['attack'], '--input', job['input']] + job['options'])
+    result = {'id': job['id'], 'attack': job['attack'], 'input': job['input'], 'pid': os.getpid()}
+    recorder = instrument.enable(memory=memory)
+    start = time.perf_counter()
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            result.update(ATTACKS[args.attack].run(args))
+        result['status'] = DONE
+    except Exception as error:
+        result['status'] = ERROR
+        result['error'] = '{}: {}'.format(type(error).__name__, error)
+    finally:
+        instrument.disable()
+    result['wall_s'] = time.perf_counter() - start
+    result.update(recorder.report())
+    result['finished'] = datetime.datetime.now().isoformat(timespec='seconds')
+    return result
+
+
+if __name__ == '__main__':
+    description = """
+Run attacks on many datasets with a pool of worker processes.
+
+The jobs are either read from a manifest with one JSON object per line, e.g.
+    {"attack": "dpa", "input": "device_3/traces.h5", "options": ["--plot-dpa", "--save-plot"]}
+or found in a directory: HDF5 files are attacked with the DPA, CSV & .npy files with the DFA and
+folders containing timings.csv with the DTA.
+
+Every finished job is appended to the results file. Jobs that are already in there are skipped,
+so an interrupted campaign can be resumed by running the same command again.
+    """
+    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('jobs', type=str, help='A manifest (.jsonl) or a directory with datasets.')
+    parser.add_argument('--results', type=str, default=DEFAULT_RESULTS,
+                        help='The JSON lines file the results are appended to.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Number of worker processes.')
+    parser.add_argument('--options', nargs=argparse.REMAINDER, default=[],
+                        help='Options passed to every attack of a directory, e.g. --options --plot-dpa.')
+    parser.add_argument('--memory', action='store_true',
+                        help='Trace the peak memory of every stage, slows down the attacks a bit.')
+    parser.add_argument('--retry-errors', action='store_true',
+                        help='Run jobs again which failed with an error.')
+    args = parser.parse_args()
+
+    try:
+        if os.path.isdir(args.jobs):
+            jobs = scan_directory(args.jobs, args.options)
+        else:
+            jobs = read_manifest(args.jobs)
+    except (ValueError, KeyError, json.JSONDecodeError) as error:
+        parser.error(str(error))
+
+    previous = read_results(args.results)
+    pending = [job for job in jobs
+               if job['id'] not in previous or (args.retry_errors and previous[job['id']]['status'] == ERROR)]
+    print("{} jobs, {} already done, {} to run on {} workers.".format(
+        len(jobs), len(jobs) - len(pending), len(pending), args.workers))
+
+    finished = 0
+    with open(args.results, 'a') as results, \
+         concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(run_job, job, args.memory): job for job in pending}
+        for future in concurrent.futures.as_completed(futures):
+            job = futures[future]
+            finished += 1
+            try:
+                result = future.result()
+            except Exception as error:
+                # A worker died, e.g. because it ran out of memory. The job is
+                # not recorded, so it runs again when the campaign is resumed.
+                print("[{}/{}] {} {}: worker failed, {}".format(finished, len(pending), job['attack'],
+                                                               job['input'], error))
+                continue
+            results.write(json.dumps(result) + '\n')
+            results.flush()
+            if result['status'] == DONE:
+                status = 'success' if result['success'] else 'wrong key'
+                print("[{}/{}] {} {}: {} {} ({:.3f} s)".format(finished, len(pending), job['attack'], job['input'],
+                                                              status, result['key'], result['wall_s']))
+            else:
+                print("[{}/{}] {} {}: {}".format(finished, len(pending), job['attack'], job['input'],
+                                                 result['error']))
@@ -0,0 +1,326 @@
+"""
+Benchmark of the DPA, DFA and DTA on synthetic datasets.
+
+Every case runs in a fresh process, so peak memory is not polluted by earlier
+cases. The results are written as JSON and can be compared to the results of
+another commit with --compare.
+"""
+import argparse
+import contextlib
+import datetime
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+DTA_STR = 'dta'
+DPA_STR = 'dpa'
+DFA_STR = 'dfa'
+
+DEFAULT_OUTPUT = 'benchmark_results.json'
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB, since the start or the last reset_peak_rss()."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def reset_peak_rss() -> bool:
+    """Reset the peak resident set size to the current one, only possible on Linux.
+
+    Returns:
+        bool: Whether the peak was reset, otherwise peak_rss_mb() is the peak since the start of the process.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def generate_dataset(attack: str, params: dict, directory: str, seed: int) -> 'tuple(str, object)':
+    """Generate the synthetic dataset of one benchmark case.
+
+    Returns:
+        tuple(str, object): The input path for the attack and the expected key.
+    """
+    if attack == DPA_STR:
+        from synthetic import dpa
+        path = os.path.join(directory, 'traces.h5')
+        key = dpa.generate(path, params['traces'], params['samples'], seed=seed)
+        return path, key.tolist()
+    if attack == DFA_STR:
+        from synthetic import dfa
+        path = os.path.join(directory, 'faulty_pairs.' + params['format'])
+        key = dfa.generate(path, params['pairs'], seed=seed)
+        return path, key.tolist()
+    from synthetic import dta
+    path = os.path.join(directory, 'dta')
+    key = dta.generate(path, params['timings'], params['modulus_bits'], seed=seed)
+    return path, key
+
+
+def run_case(attack: str, input_path: str, expected_key, params: dict) -> dict:
+    """Load the dataset and run the attack, measuring every stage.
+
+    Meant to be executed in a child process. The throughput of a stage is
+    given in traces, faulty pairs or timings per second. The inner stages of
+    the attack are timed with the instrumentation, without memory tracing.
+    The peak RSS of a stage is its own peak where it can be reset (Linux),
+    otherwise the peak of the process up to the end of the stage.
+    """
+    import instrument
+    stages = {}
+    recorder = instrument.enable(memory=False)
+
+    def measure(name, function):
+        reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            return function()
+        finally:
+            stages[name] = {'wall_s': time.perf_counter() - start, 'peak_rss_mb': peak_rss_mb()}
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if attack == DPA_STR:
+            from aes_dpa import dpa
+            from aes.cipher import expand_key
+            runner = measure('load', lambda: dpa.DPA(input_path, params['precision']))
+            items = runner.reader.traces.shape[0]
+            key = measure('attack', runner.perform_dpa)
+            success = bool((np.asarray(key) == expand_key(expected_key)[10]).all())
+        elif attack == DFA_STR:
+            from aes_dfa import dfa
+            from aes.cipher import expand_key
+            runner = measure('load', lambda: dfa.DFA(input_path))
+            items = len(runner.reader.ciphertexts)
+            try:
+                key = measure('attack', runner.perform_dfa)
+                success = bool((np.asarray(key) == expand_key(expected_key)[10]).all())
+            except TypeError:
+                # perform_dfa() fails if the pairs do not determine the key uniquely
+                success = False
+        else:
+            from rsa_dta import dta
+            runner = measure('load', lambda: dta.DTA(input_path))
+            items = len(runner.reader.timings)
+            try:
+                key = measure('attack', runner.perform_timing_attack)
+                success = key == expected_key
+            except AssertionError:
+                # perform_timing_attack() asserts that the recovered key is correct
+                success = False
+
+    instrument.disable()
+    for stage in stages.values():
+        stage['throughput'] = items / stage['wall_s'] if stage['wall_s'] > 0 else None
+    return {'success': success, 'stages': stages, 'instrumented': recorder.report()}
+
+
+def check_precision(input_path: str, precision: str) -> dict:
+    """Compare the DPA correlations in a working precision with float64 on the same traces.
+
+    Meant to be executed in a child process, it is not part of the measurements.
+    The correlations are compared as kept for plotting, i.e. their min/max
+    envelopes for long traces, which contain the peak of every key hypothesis.
+
+    Returns:
+        dict: Whether every byte ranks the key hypotheses the same & has the same best hypothesis,
+            the number of bytes with another ranking, the largest float64 peak difference of two
+            hypotheses ranked the other way round and the maximum absolute difference of the correlations.
+    """
+    from aes_dpa import dpa
+    envelopes = {}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for name in (dpa.FLOAT64, precision):
+            runner = dpa.DPA(input_path, name)
+            runner.perform_dpa(keep_correlations=True)
+            envelopes[name] = np.array([envelope for _, _, envelope in runner.correlations], dtype=np.float64)
+
+    # Peak of the absolute correlation of every hypothesis of every byte & the hypotheses by descending peak
+    peaks = {name: np.absolute(envelope).max(axis=2) for name, envelope in envelopes.items()}
+    rankings = {name: np.argsort(-peak, axis=1, kind='stable') for name, peak in peaks.items()}
+    same = (rankings[dpa.FLOAT64] == rankings[precision]).all(axis=1)
+    # The float64 peaks in the order of the other precision, a rise is a pair ranked the other way round
+    reordered = np.take_along_axis(peaks[dpa.FLOAT64], rankings[precision], axis=1)
+    inversion = (reordered - np.minimum.accumulate(reordered, axis=1)).max()
+    return {'reference': dpa.FLOAT64,
+            'same_ranking': bool(same.all()),
+            'same_best_hypothesis': bool((rankings[dpa.FLOAT64][:, 0] == rankings[precision][:, 0]).all()),
+            'bytes_with_other_ranking': int((~same).sum()),
+            'max_rank_inversion': float(inversion),
+            'max_correlation_difference': float(np.absolute(envelopes[dpa.FLOAT64] - envelopes[precision]).max())}
+
+
+def expand_grid(args) -> 'list[tuple(str, dict)]':
+    """Build the list of benchmark cases from the command line arguments."""
+    cases = []
+    if DPA_STR in args.attacks:
+        for traces, samples, precision in itertools.product(args.dpa_traces, args.dpa_samples,
+                                                            args.dpa_precisions):
+            cases.append((DPA_STR, {'traces': traces, 'samples': samples, 'precision': precision}))
+    if DFA_STR in args.attacks:
+        for pairs, dfa_format in itertools.product(args.dfa_pairs, args.dfa_formats):
+            cases.append((DFA_STR, {'pairs': pairs, 'format': dfa_format}))
+    if DTA_STR in args.attacks:
+        for timings, bits in itertools.product(args.dta_timings, args.dta_modulus_bits):
+            cases.append((DTA_STR, {'timings': timings, 'modulus_bits': bits}))
+    return cases
+
+
+def summarize(runs: 'list[dict]') -> dict:
+    """Reduce repeated runs of one case to the median per stage."""
+    stages = {}
+    for name in runs[0]['stages']:
+        values = [run['stages'][name] for run in runs]
+        stages[name] = {metric: statistics.median(value[metric] for value in values)
+                        if values[0][metric] is not None else None
+                        for metric in values[0]}
+        stages[name]['wall_s_min'] = min(value['wall_s'] for value in values)
+    instrumented = {
+        'stages': {name: {'calls': entry['calls'],
+                          'wall_s': statistics.median(run['instrumented']['stages'].get(name, entry)['wall_s']
+                                                      for run in runs)}
+                   for name, entry in runs[0]['instrumented']['stages'].items()},
+        'counters': runs[0]['instrumented']['counters'],
+    }
+    return {'success': all(run['success'] for run in runs), 'stages': stages, 'instrumented': instrumented}
+
+
+def metadata(args) -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'repeat': args.repeat,
+        'seed': args.seed,
+        # Whether peak_rss_mb is the peak of every stage or of the process up to its end
+        'peak_rss_scope': 'stage' if sys.platform.startswith('linux') and os.path.exists('/proc/self/clear_refs')
+                          else 'cumulative',
+    }
+
+
+def compare(results: dict, baseline: dict):
+    """Print the attack time of every case relative to a baseline result file."""
+    def case_key(result):
+        params = dict(result['params'])
+        if result['attack'] == DPA_STR:
+            # Results of earlier versions have no precision, they ran in float64
+            params.setdefault('precision', 'float64')
+        return result['attack'], json.dumps(params, sort_keys=True)
+
+    old = {case_key(result): result for result in baseline['results']}
+    print("\nComparison with commit {}:".format(baseline['meta'].get('commit')))
+    for result in results['results']:
+        previous = old.get(case_key(result))
+        if previous is None:
+            continue
+        for stage, values in result['stages'].items():
+            if stage not in previous['stages']:
+                continue
+            ratio = values['wall_s'] / previous['stages'][stage]['wall_s']
+            print("  {:<4} {:<40} {:<7} {:>6.2f}x".format(result['attack'], str(result['params']), stage, ratio))
+
+
+def print_result(attack: str, params: dict, result: dict):
+    print("{:<4} {:<40} success={!s:<5} load={:.3f}s attack={:.3f}s peak={:.1f}MiB".format(
+        attack, str(params), result['success'], result['stages']['load']['wall_s'],
+        result['stages']['attack']['wall_s'],
+        max(stage['peak_rss_mb'] for stage in result['stages'].values())))
+    if 'precision_check' in result:
+        check = result['precision_check']
+        print("     vs {}: same best={} same ranking={} ({} bytes differ, max inversion {:.2e}), "
+              "max correlation difference {:.2e}".format(
+                  check['reference'], check['same_best_hypothesis'], check['same_ranking'],
+                  check['bytes_with_other_ranking'], check['max_rank_inversion'],
+                  check['max_correlation_difference']))
+
+
+if __name__ == '__main__':
+    description = """
+Benchmark the attacks on synthetic datasets of different sizes.
+
+For every combination of the size parameters of an attack a dataset is generated and the attack is run
+--repeat times in a fresh process. Wall time, peak RSS and throughput of every stage are written to --output.
+The DPA in another precision than float64 is also checked for the same ranking of the key hypotheses.
+    """
+    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawTextHelpFormatter)
+
+    parser.add_argument('--attacks', nargs='+', choices=[DTA_STR, DPA_STR, DFA_STR],
+                        default=[DTA_STR, DPA_STR, DFA_STR],
+                        help='The attacks to benchmark.')
+    parser.add_argument('--dpa-traces', nargs='+', type=int, default=[250, 500, 1000],
+                        help='Numbers of traces for the DPA.')
+    parser.add_argument('--dpa-samples', nargs='+', type=int, default=[100, 1000],
+                        help='Numbers of samples per trace for the DPA.')
+    parser.add_argument('--dpa-precisions', nargs='+', choices=['float64', 'float32'], default=['float64'],
+                        help='Working precisions of the DPA correlation.')
+    parser.add_argument('--dfa-pairs', nargs='+', type=int, default=[2, 100, 10000],
+                        help='Numbers of faulty pairs for the DFA.')
+    parser.add_argument('--dfa-formats', nargs='+', choices=['csv', 'npy'], default=['csv', 'npy'],
+                        help='File formats of the faulty pairs for the DFA.')
+    parser.add_argument('--dta-timings', nargs='+', type=int, default=[8000, 16000, 32000],
+                        help='Numbers of timings for the DTA.')
+    parser.add_argument('--dta-modulus-bits', nargs='+', type=int, default=[64],
+                        help='Bit lengths of the RSA modulus for the DTA.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='How often every case is run.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed for the synthetic datasets.')
+    parser.add_argument('--output', type=str, default=DEFAULT_OUTPUT,
+                        help='The JSON file to write the results to.')
+    parser.add_argument('--compare', type=str,
+                        help='A previous result file to compare the attack times with.')
+
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    results = {'meta': metadata(args), 'results': []}
+    for attack, params in expand_grid(args):
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            input_path, expected_key = generate_dataset(attack, params, directory, args.seed)
+            generate_time = time.perf_counter() - start
+            runs = []
+            for _ in range(args.repeat):
+                with context.Pool(1) as pool:
+                    runs.append(pool.apply(run_case, (attack, input_path, expected_key, params)))
+            precision_check = None
+            if attack == DPA_STR and params['precision'] != 'float64':
+                with context.Pool(1) as pool:
+                    precision_check = pool.apply(check_precision, (input_path, params['precision']))
+        result = summarize(runs)
+        if precision_check is not None:
+            result['precision_check'] = precision_check
+        result['generate_s'] = generate_time
+        print_result(attack, params, result)
+        results['results'].append({'attack': attack, 'params': params, **result})
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print("Results written to", args.output)
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            compare(results, json.load(file))
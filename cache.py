@@ -0,0 +1,152 @@
+"""
+Content-addressed cache of attack results & intermediates.
+
+An entry is identified by a hash of the contents of the input files and of
+the attack parameters, so it is found again for the same data under another
+path and never used for changed data. An entry is a folder with the result of
+the attack as JSON and its intermediates as .npy files, which are read
+memory-mapped, e.g. the correlation summaries of the DPA, the column
+candidates of the DFA and the Montgomery-domain inputs of the DTA.
+
+The cache folder is bounded in size, the least recently used entries are
+removed when it grows beyond the limit. The hash of an input is remembered by
+the paths, sizes & modification times of its files, so a repeated run does
+not read the input again.
+"""
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from checkpoint import fingerprint, input_files, write_atomic
+
+DEFAULT_DIRECTORY = '.attack_cache'
+DEFAULT_SIZE_MB = 1024
+# Entries of another layout are not found anymore
+VERSION = 1
+RESULT_FILE = 'result.json'
+HASH_INDEX = 'hashes.json'
+MAX_HASHES = 1024
+HASH_BLOCK = 1 << 24
+
+
+def content_hash(input_path: str) -> str:
+    """The SHA-256 of the contents of the files of an input, and of their names in a folder."""
+    digest = hashlib.sha256()
+    for file in input_files(input_path):
+        if os.path.isdir(input_path):
+            digest.update(os.path.basename(file).encode() + b'\0')
+        with open(file, 'rb') as data:
+            for block in iter(lambda: data.read(HASH_BLOCK), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class Cache:
+    """A folder of cache entries, bounded in size."""
+
+    def __init__(self, directory: str = DEFAULT_DIRECTORY, size_mb: float = DEFAULT_SIZE_MB) -> None:
+        """
+        Args:
+            directory (str, optional): The cache folder, created if it does not exist.
+            size_mb (float, optional): The maximum size of all entries in MiB.
+        """
+        self.directory = directory
+        self.max_bytes = int(size_mb * (1 << 20))
+        os.makedirs(directory, exist_ok=True)
+
+    def input_hash(self, input_path: str) -> str:
+        """The content_hash() of an input, only computed again if its files have changed."""
+        index_path = os.path.join(self.directory, HASH_INDEX)
+        try:
+            with open(index_path, 'r') as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            index = {}
+        stats = fingerprint('', input_path)
+        if stats not in index:
+            index[stats] = content_hash(input_path)
+            # Keep the most recent hashes
+            index = dict(list(index.items())[-MAX_HASHES:])
+            try:
+                write_atomic(index_path, lambda file: file.write(json.dumps(index).encode()))
+            except OSError:
+                # Lost a race with another process, the hash is only computed again next time
+                pass
+        return index[stats]
+
+    def entry(self, attack: str, input_path: str, **params) -> 'CacheEntry':
+        """The entry of an attack with the given parameters on an input."""
+        description = {'version': VERSION, 'attack': attack, 'input': self.input_hash(input_path), 'params': params}
+        key = hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+        entry = CacheEntry(self, os.path.join(self.directory, key))
+        self.evict(keep=entry.path)
+        return entry
+
+    def evict(self, keep: str = None):
+        """Remove the least recently used entries until the cache fits into its size.
+
+        Args:
+            keep (str, optional): The folder of an entry which is not removed, e.g. the one being written.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.isdir(path):
+                    size = sum(os.path.getsize(os.path.join(path, file)) for file in os.listdir(path))
+                    entries.append((os.stat(path).st_mtime_ns, path, size))
+            except FileNotFoundError:
+                # Removed by another process using the same cache
+                continue
+        total = sum(size for _, _, size in entries)
+        for _, path, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+
+class CacheEntry:
+    """The result & intermediates of one attack on one input."""
+
+    def __init__(self, cache: Cache, path: str) -> None:
+        self.cache = cache
+        self.path = path
+        if os.path.isdir(path):
+            # Mark as recently used
+            os.utime(path)
+
+    def __file(self, name: str) -> str:
+        return os.path.join(self.path, name + '.npy')
+
+    def __contains__(self, name: str) -> bool:
+        return os.path.exists(self.__file(name))
+
+    def get(self, name: str) -> np.ndarray:
+        """A memory-mapped intermediate, None if it is not cached."""
+        try:
+            return np.load(self.__file(name), mmap_mode='r')
+        except FileNotFoundError:
+            return None
+
+    def put(self, name: str, array: np.ndarray):
+        """Store an intermediate."""
+        os.makedirs(self.path, exist_ok=True)
+        write_atomic(self.__file(name), lambda file: np.save(file, np.asarray(array)))
+        self.cache.evict(keep=self.path)
+
+    @property
+    def result(self) -> dict:
+        """The result of the attack, None if it has not finished yet."""
+        try:
+            with open(os.path.join(self.path, RESULT_FILE), 'r') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def store_result(self, result: dict):
+        os.makedirs(self.path, exist_ok=True)
+        write_atomic(os.path.join(self.path, RESULT_FILE), lambda file: file.write(json.dumps(result).encode()))
+        self.cache.evict(keep=self.path)
@@ -0,0 +1,133 @@
+"""
+Checkpoints of long running attacks.
+
+An attack updates its state at consistent points, e.g. after every key
+byte, with Checkpoint.update(). The state is a dictionary of NumPy arrays and
+is written as compressed .npz file at most every interval seconds. The file is
+replaced atomically, so an interruption leaves the previous checkpoint intact.
+
+Every checkpoint records a fingerprint of the attack & its input files, a
+checkpoint of another attack or of changed input data is never resumed but
+replaced. The default path contains a hash of the fingerprint, so attacks on
+different inputs don't share a checkpoint.
+"""
+import hashlib
+import os
+import tempfile
+import time
+import numpy as np
+
+DEFAULT_PATH = 'checkpoint_{}_{}.npz'
+DEFAULT_INTERVAL = 60.0
+FINGERPRINT = 'fingerprint'
+
+
+def write_atomic(path: str, write):
+    """Write a file with write(file) to a temporary file & replace path with it.
+
+    The temporary file is unique, so several processes can write the same file
+    at once, e.g. when they share a checkpoint or cache, the last one wins.
+    """
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                             prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            write(file)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def input_files(input_path: str) -> 'list[str]':
+    """The absolute paths of the files of an input, a single file or the files of a folder."""
+    input_path = os.path.abspath(input_path)
+    if os.path.isdir(input_path):
+        files = [os.path.join(input_path, name) for name in sorted(os.listdir(input_path))]
+    else:
+        files = [input_path]
+    return [file for file in files if os.path.isfile(file)]
+
+
+def fingerprint(attack: str, input_path: str) -> str:
+    """Identify an attack on an input by the paths, sizes & modification times of the input files."""
+    stats = ['{}:{}:{}'.format(file, os.stat(file).st_size, os.stat(file).st_mtime_ns)
+             for file in input_files(input_path)]
+    return '|'.join([attack] + stats)
+
+
+def default_path(attack: str, fingerprint: str) -> str:
+    """The checkpoint file of an attack on an input, identified by its fingerprint()."""
+    return DEFAULT_PATH.format(attack, hashlib.sha256(fingerprint.encode()).hexdigest()[:12])
+
+
+class Checkpoint:
+    """The saved state of one attack run."""
+
+    def __init__(self, path: str, fingerprint: str, interval: float = DEFAULT_INTERVAL, resume: bool = False) -> None:
+        """
+        Args:
+            path (str): The .npz file of the checkpoint.
+            fingerprint (str): The fingerprint() of the attack & its input.
+            interval (float, optional): Minimum time in seconds between two writes.
+            resume (bool, optional): Whether to load the state of the existing checkpoint.
+        """
+        self.path = path
+        self.fingerprint = fingerprint
+        self.interval = interval
+        # Whether the existing checkpoint belongs to another attack or input & is replaced
+        self.stale = False
+        self.state = self.load() if resume else {}
+        self.resumed = bool(self.state)
+        self.__written = time.monotonic()
+
+    def load(self) -> dict:
+        """Read the state of the checkpoint file.
+
+        Returns:
+            dict: The state, empty if there is no checkpoint or it belongs to another attack or input.
+        """
+        if not os.path.exists(self.path):
+            return {}
+        with np.load(self.path) as file:
+            state = {name: file[name] for name in file.files}
+        if str(state.pop(FINGERPRINT)) != self.fingerprint:
+            self.stale = True
+            return {}
+        return state
+
+    def due(self) -> bool:
+        """Whether the interval since the last write has passed."""
+        return time.monotonic() - self.__written >= self.interval
+
+    def update(self, **arrays):
+        """Add arrays to the state and write it if due."""
+        self.state.update(arrays)
+        if self.due():
+            self.write()
+
+    def remove(self):
+        """Delete the checkpoint file, e.g. after the attack has succeeded."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def write(self):
+        """Write the state now, replacing the previous checkpoint."""
+        write_atomic(self.path, lambda file: np.savez_compressed(file, **{FINGERPRINT: self.fingerprint},
+                                                                  **self.state))
+        self.__written = time.monotonic()
+
+
+def encode_ints(values: 'list[int]') -> np.ndarray:
+    """Encode non-negative Python integers of any size as rows of little endian bytes."""
+    width = max([(value.bit_length() + 7) // 8 for value in values] + [1])
+    data = b''.join(value.to_bytes(width, 'little') for value in values)
+    return np.frombuffer(data, dtype=np.uint8).reshape(len(values), width)
+
+
+def decode_ints(array: np.ndarray) -> 'list[int]':
+    """Decode the integers of encode_ints()."""
+    data = array.tobytes()
+    width = array.shape[1]
+    return [int.from_bytes(data[i:i + width], 'little') for i in range(0, len(data), width)]
@@ -0,0 +1,21 @@
+"""
+Convert a DFA fault campaign from CSV to the binary format.
+
+The binary file is a .npy array of shape (3, pairs, 16) with the plaintexts,
+ciphertexts & faulty ciphertexts, which the DFA memory-maps instead of parsing.
+"""
+import argparse
+import time
+import reader as rd
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('input', type=str, help='The CSV file with the faulty pairs.')
+    parser.add_argument('output', type=str, help='The .npy file to write.')
+    args = parser.parse_args()
+
+    if not args.output.endswith(rd.DFA_BINARY_EXTENSION):
+        parser.error("The output file needs the extension " + rd.DFA_BINARY_EXTENSION)
+    start = time.perf_counter()
+    pairs = rd.convert_dfa_csv(args.input, args.output)
+    print("Converted {} pairs in {:.3f} s.".format(pairs, time.perf_counter() - start))
@@ -0,0 +1,110 @@
+"""
+Generate synthetic input data for the attacks.
+
+The datasets are written chunk by chunk, so they can be much larger than the memory.
+"""
+import argparse
+import sys
+import numpy as np
+from aes.cipher import expand_key
+from synthetic import dpa, dfa, dta
+
+DTA_STR = 'dta'
+DPA_STR = 'dpa'
+DFA_STR = 'dfa'
+FEED_STR = 'feed'
+
+
+def parse_key(key: str) -> np.ndarray:
+    if key is None:
+        return None
+    return np.frombuffer(bytes.fromhex(key), dtype=np.uint8)
+
+
+def to_hex(key) -> str:
+    return bytes(np.asarray(key, dtype=np.uint8)).hex().upper()
+
+
+if __name__ == '__main__':
+    description = """
+Generate synthetic input data for the attacks:
+    - dpa: AES last round power traces (HDF5) with Hamming weight or Hamming distance leakage
+    - dfa: AES faulty ciphertext pairs (CSV) with a single byte fault
+    - dta: RSA timings (CSV files in a folder) of a Montgomery square-and-multiply
+    - feed: AES power traces sent to the live DPA (attacks.py dpa-live) as a stand-in for a measurement setup
+
+The generated data can be attacked with: python3 attacks.py <attack> --input <output>
+    """
+    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawTextHelpFormatter)
+    subparsers = parser.add_subparsers(dest='attack', required=True)
+
+    dpa_parser = subparsers.add_parser(DPA_STR, help='Generate power traces.')
+    dpa_parser.add_argument('output', type=str, help='The HDF5 file to write.')
+    dpa_parser.add_argument('--traces', type=int, default=10000, help='Number of traces.')
+    dpa_parser.add_argument('--compression', choices=['gzip', 'lzf'], help='HDF5 compression of the traces.')
+    dpa_parser.add_argument('--masked', action='store_true',
+                            help='Mask the state bytes, their 2 shares leak at 2 samples (second-order DPA).')
+
+    feed_parser = subparsers.add_parser(FEED_STR, help='Feed power traces to the live DPA.')
+    feed_parser.add_argument('output', type=str,
+                             help='The Unix socket of the live DPA, - for the standard output or a growing HDF5 file.')
+    feed_parser.add_argument('--traces', type=int, default=100000, help='Maximum number of traces.')
+    feed_parser.add_argument('--rate', type=float, help='Traces per second, as fast as possible if not given.')
+    feed_parser.add_argument('--batch', type=int, default=100, help='Number of traces sent at once.')
+
+    for subparser in (dpa_parser, feed_parser):
+        subparser.add_argument('--samples', type=int, default=1000, help='Number of samples per trace.')
+        subparser.add_argument('--model', choices=dpa.LEAKAGE_MODELS, default=dpa.HW_MODEL,
+                               help='Leakage model: Hamming weight or Hamming distance.')
+        subparser.add_argument('--noise', type=float, default=1.0, help='Standard deviation of the noise.')
+        subparser.add_argument('--gain', type=float, default=8.0, help='Amplitude of one bit of leakage.')
+        subparser.add_argument('--jitter', type=int, default=0, help='Maximum shift of a trace in samples.')
+        subparser.add_argument('--dtype', choices=['uint8', 'int8', 'int16'], default='uint8',
+                               help='Integer type of the samples.')
+
+    dfa_parser = subparsers.add_parser(DFA_STR, help='Generate faulty ciphertext pairs.')
+    dfa_parser.add_argument('output', type=str, help='The CSV file to write.')
+    dfa_parser.add_argument('--pairs', type=int, default=1000, help='Number of faulty pairs.')
+    dfa_parser.add_argument('--fault-round', type=int, default=dfa.FAULT_ROUND,
+                            help='Round at whose input the fault is injected.')
+    dfa_parser.add_argument('--fault-byte', type=int, default=dfa.FAULT_BYTE,
+                            help='State byte the fault is injected into.')
+
+    dta_parser = subparsers.add_parser(DTA_STR, help='Generate RSA timings.')
+    dta_parser.add_argument('output', type=str, help='The folder to write the CSV files to.')
+    dta_parser.add_argument('--timings', type=int, default=10000, help='Number of timings.')
+    dta_parser.add_argument('--modulus-bits', type=int, default=64, help='Bit length of the modulus.')
+    dta_parser.add_argument('--key-bits', type=int, help='Bit length of the secret exponent.')
+    dta_parser.add_argument('--noise', type=float, default=5000.0, help='Standard deviation of the noise.')
+
+    for subparser in (dpa_parser, feed_parser, dfa_parser):
+        subparser.add_argument('--key', type=str, help='The AES key as hex string, random if not given.')
+    for subparser in (dpa_parser, feed_parser, dfa_parser, dta_parser):
+        subparser.add_argument('--seed', type=int, help='Seed of the random generator.')
+
+    args = parser.parse_args()
+
+    if args.attack == DPA_STR:
+        key = dpa.generate(args.output, args.traces, args.samples, key=parse_key(args.key), model=args.model,
+                           noise=args.noise, gain=args.gain, jitter=args.jitter, dtype=args.dtype,
+                           compression=args.compression, masked=args.masked, seed=args.seed)
+        print("Key:", to_hex(key))
+        print("Last round key:", to_hex(expand_key(key)[10]))
+    elif args.attack == FEED_STR:
+        from synthetic import feed
+        key, sent = feed.feed(args.output, args.traces, args.samples, key=parse_key(args.key), model=args.model,
+                              noise=args.noise, gain=args.gain, jitter=args.jitter, dtype=args.dtype, rate=args.rate,
+                              batch_traces=args.batch, seed=args.seed)
+        # The standard output may carry the traces
+        print("Key:", to_hex(key), file=sys.stderr)
+        print("Last round key:", to_hex(expand_key(key)[10]), file=sys.stderr)
+        print("Traces sent:", sent, file=sys.stderr)
+    elif args.attack == DFA_STR:
+        key = dfa.generate(args.output, args.pairs, key=parse_key(args.key), fault_round=args.fault_round,
+                           fault_byte=args.fault_byte, seed=args.seed)
+        print("Key:", to_hex(key))
+        print("Last round key:", to_hex(expand_key(key)[10]))
+    else:
+        d = dta.generate(args.output, args.timings, args.modulus_bits, key_bits=args.key_bits,
+                         noise=args.noise, seed=args.seed)
+        print("Secret exponent:", hex(d)[2:].upper())
@@ -0,0 +1,152 @@
+"""
+Lightweight instrumentation of the attack stages.
+
+The attacks mark their stages with stage() and count events with count().
+Both do nothing until enable() is called, so the instrumentation costs no
+more than a function call when it is disabled.
+
+When enabled, every stage records its number of calls & wall time and,
+optionally, its peak memory as traced by tracemalloc (NumPy arrays
+included). Nested stages are allowed, the peak of a stage includes the peaks
+of its children. Optionally the whole run is profiled with cProfile.
+"""
+import contextlib
+import functools
+import time
+import tracemalloc
+
+MB = 1024 * 1024
+TOP_FUNCTIONS = 25
+
+_recorder = None
+_null_stage = contextlib.nullcontext()
+
+
+class Recorder:
+    """Collects the measurements of all stages and counters."""
+
+    def __init__(self, memory: bool = True, profile: bool = False) -> None:
+        self.memory = memory
+        self.stages = {}
+        self.counters = {}
+        # Stack of the peak memory seen so far by every open stage
+        self.__peaks = []
+        self.profiler = None
+        if profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.profiler:
+            self.profiler.enable()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        entry = self.stages.setdefault(name, {'calls': 0, 'wall_s': 0.0})
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.__peaks:
+                self.__peaks[-1] = max(self.__peaks[-1], peak)
+            tracemalloc.reset_peak()
+            self.__peaks.append(current)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry['calls'] += 1
+            entry['wall_s'] += time.perf_counter() - start
+            if self.memory:
+                peak = max(self.__peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if self.__peaks:
+                    self.__peaks[-1] = max(self.__peaks[-1], peak)
+                entry['peak_mem_mb'] = max(entry.get('peak_mem_mb', 0.0), (peak - current) / MB)
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def stop(self):
+        if self.profiler:
+            self.profiler.disable()
+        if self.memory:
+            tracemalloc.stop()
+
+    def report(self) -> dict:
+        """The measurements as a JSON serialisable dictionary."""
+        result = {'stages': self.stages, 'counters': self.counters}
+        if self.profiler:
+            import pstats
+            stats = pstats.Stats(self.profiler)
+            functions = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_FUNCTIONS]
+            result['cprofile'] = [{'function': '{}:{}({})'.format(*function),
+                                   'calls': calls,
+                                   'tottime_s': tottime,
+                                   'cumtime_s': cumtime}
+                                  for function, (_, calls, tottime, cumtime, _) in functions]
+        return result
+
+    def dump_profile(self, path: str):
+        """Write the cProfile statistics, e.g. for snakeviz or pstats."""
+        import pstats
+        pstats.Stats(self.profiler).dump_stats(path)
+
+
+def enable(memory: bool = True, profile: bool = False) -> Recorder:
+    """Start recording.
+
+    Args:
+        memory (bool, optional): Whether to trace the peak memory of every stage.
+        profile (bool, optional): Whether to profile the run with cProfile.
+
+    Returns:
+        Recorder: The recorder collecting the measurements.
+    """
+    global _recorder
+    _recorder = Recorder(memory, profile)
+    return _recorder
+
+
+def disable() -> Recorder:
+    """Stop recording and return the recorder, if there was one."""
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder:
+        recorder.stop()
+    return recorder
+
+
+def stage(name: str):
+    """Context manager measuring the enclosed code as stage name."""
+    if _recorder is None:
+        return _null_stage
+    return _recorder.stage(name)
+
+
+def count(name: str, n: int = 1):
+    """Add n to the counter name."""
+    if _recorder is not None:
+        _recorder.count(name, n)
+
+
+def timed(name: str):
+    """Decorator measuring every call of the function as stage name."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return function(*args, **kwargs)
+            with _recorder.stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def summary(report: dict) -> str:
+    """Format the stages & counters of a report as a table."""
+    lines = ["{:<28} {:>7} {:>11} {:>13}".format('Stage', 'Calls', 'Time [s]', 'Peak [MiB]')]
+    for name, entry in report['stages'].items():
+        peak = entry.get('peak_mem_mb')
+        lines.append("{:<28} {:>7} {:>11.4f} {:>13}".format(
+            name, entry['calls'], entry['wall_s'], '-' if peak is None else '{:.2f}'.format(peak)))
+    for name, value in report['counters'].items():
+        lines.append("{:<28} {:>7}".format(name, value))
+    return '\n'.join(lines)
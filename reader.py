@@ -1,7 +1,8 @@
 import numpy as np
-import h5py
 import csv
 import os
+import queue
+import threading
 
 # path of the traces hdf5 file which will be used in the dpa analysis
 DEFAULT_DPA_TRACES_PATH = 'aes_dpa/traces/sample_trace.h5'
@@ -9,7 +10,17 @@ DEFAULT_DTA_INPUT_PATH = 'rsa_dta/input_files'
 DTA_INPUT_FILE = 'inputs.csv'
 DTA_TIMING_FILE = 'timings.csv'
 DTA_TESTING_PAIR_FILE = 'testing_pair.csv'
+DTA_MODULUS_FILE = 'modulus.csv'
+DEFAULT_DTA_MODULUS = 0xB935E2B84B83E9EB
+DEFAULT_DTA_KEY_BITS = 64
 DEFAULT_DFA_INPUT_PATH = 'aes_dfa/faulty_pairs.csv'
+# Binary DFA campaigns: one uint8 array of shape (3, pairs, 16) holding
+# the plaintexts, ciphertexts & faulty ciphertexts
+DFA_BINARY_EXTENSION = '.npy'
+DFA_CHUNK_ROWS = 1 << 16
+# Traces read at once by DPAReader.read_chunks() & the number of chunks read ahead
+DPA_CHUNK_TRACES = 4096
+DPA_PREFETCH_DEPTH = 2
 
 class Reader:
     def __init__(self, input_path: str) -> None:
@@ -24,9 +35,21 @@ class Reader:
 class DPAReader(Reader):
     """Class used to load traces measured with measuring script."""
 
-    def __init__(self, input_path: str):
+    def __init__(self, input_path: str, dtype=np.int16, load_traces: bool = True):
+        """
+        Args:
+            input_path (str): The HDF5 file, the default traces if empty.
+            dtype (optional): The type the traces are converted to, None keeps the stored type,
+                e.g. 8 bit samples take one byte per sample.
+            load_traces (bool, optional): Whether to load all traces into memory. Otherwise traces is
+                the HDF5 dataset, which is read with read_chunks().
+        """
         self.default_input_path = DEFAULT_DPA_TRACES_PATH
+        self.dtype = dtype
+        self.load_traces = load_traces
         super().__init__(input_path)
+        # Only the DPA needs h5py, don't import it for the other attacks
+        import h5py
         self.hdf5_file = h5py.File(self.input_path, "r")
         (self.traces, 
          self.ciphertexts, 
@@ -37,7 +60,11 @@ class DPAReader(Reader):
 
     def __get_traces(self):
         """Returns measured traces in a matrix: trace-number x trace-length"""
-        traces = self.hdf5_file["traces"][:].astype(np.int16)
+        if not self.load_traces:
+            return self.hdf5_file["traces"]
+        traces = self.hdf5_file["traces"][:]
+        if self.dtype is not None:
+            traces = traces.astype(self.dtype, copy=False)
         return traces
 
     def __get_ciphertext(self):
@@ -69,6 +96,110 @@ class DPAReader(Reader):
             list: The desired column of the ciphertexts dataset.
         """
         return self.ciphertexts[:,number].astype(np.uint8)
+
+    def read_chunks(self, chunk_traces: int = DPA_CHUNK_TRACES, depth: int = DPA_PREFETCH_DEPTH, stop: int = None):
+        """Read the traces, ciphertexts & plaintexts chunk by chunk, see prefetch_chunks().
+
+        Args:
+            chunk_traces (int, optional): The number of traces per chunk.
+            depth (int, optional): The number of chunks read ahead in a background thread.
+            stop (int, optional): Read only the traces before this one.
+
+        Returns:
+            Iterator over (first trace, (traces, ciphertexts, plaintexts)) of every chunk.
+        """
+        datasets = [self.hdf5_file["traces"], self.hdf5_file["ciphertext"], self.hdf5_file["plaintext"]]
+        dtypes = [self.dtype or datasets[0].dtype, np.uint8, np.uint8]
+        return prefetch_chunks(datasets, dtypes, chunk_traces, depth, stop)
+
+
+def prefetch_chunks(datasets: list, dtypes: list, chunk_rows: int, depth: int, stop: int = None):
+    """Read HDF5 datasets chunk by chunk while the previous chunks are processed.
+
+    A background thread reads & decodes (e.g. decompresses & converts) the
+    next chunks into preallocated buffers, while the caller processes the
+    current one. So the reading & the processing overlap, the throughput
+    approaches the slower of both instead of their sum. The buffers are
+    reused: the arrays of a chunk are only valid until the next one is taken.
+
+    Args:
+        datasets (list): The HDF5 datasets, read row by row in parallel.
+        dtypes (list): The type every dataset is converted to.
+        chunk_rows (int): The number of rows per chunk.
+        depth (int): The number of chunks read ahead, 0 reads every chunk when it is taken.
+        stop (int, optional): Read only the rows before this one.
+
+    Yields:
+        tuple(int, tuple): The first row & the arrays of a chunk.
+    """
+    rows = min([len(dataset) for dataset in datasets] + ([stop] if stop is not None else []))
+    # The caller holds one buffer, the thread fills the others
+    buffers = [[np.empty((chunk_rows,) + dataset.shape[1:], dtype=dtype) for dataset, dtype in zip(datasets, dtypes)]
+               for _ in range(depth + 1)]
+
+    def read(start: int, index: int) -> int:
+        count = min(chunk_rows, rows - start)
+        for dataset, buffer in zip(datasets, buffers[index]):
+            dataset.read_direct(buffer, np.s_[start:start + count], np.s_[0:count])
+        return count
+
+    if depth == 0:
+        for start in range(0, rows, chunk_rows):
+            count = read(start, 0)
+            yield start, tuple(buffer[:count] for buffer in buffers[0])
+        return
+
+    free = queue.Queue()
+    for index in range(len(buffers)):
+        free.put(index)
+    ready = queue.Queue()
+    cancelled = threading.Event()
+
+    def produce():
+        try:
+            for start in range(0, rows, chunk_rows):
+                index = free.get()
+                if cancelled.is_set():
+                    return
+                ready.put((start, index, read(start, index)))
+        except Exception as error:
+            ready.put(error)
+        else:
+            ready.put(None)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = ready.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            start, index, count = item
+            yield start, tuple(buffer[:count] for buffer in buffers[index])
+            free.put(index)
+    finally:
+        # Stop the thread if the caller stops early
+        cancelled.set()
+        free.put(None)
+        thread.join()
+
+
+def read_dpa_trace(input_path: str, index: int = 0) -> np.ndarray:
+    """Read a single trace of a DPA dataset without loading the others.
+
+    Args:
+        input_path (str): The HDF5 file, the default traces if empty.
+        index (int, optional): The number of the trace.
+
+    Returns:
+        np.ndarray: The samples of the trace.
+    """
+    import h5py
+    with h5py.File(input_path or DEFAULT_DPA_TRACES_PATH, "r") as hdf5_file:
+        return hdf5_file["traces"][index]
+
     
 class DTAReader(Reader):
     def __init__(self, input_path: str) -> None:
@@ -77,25 +208,41 @@ class DTAReader(Reader):
         (self.timings,
          self.testing_pair,
          self.inputs) = self.__read_input_files()
+        self.modulus, self.key_bits = self.__read_modulus()
         
     def __read_input_files(self) -> 'tuple(list, list, list)':
-        csv_reader = csv.reader(open(os.path.join(self.default_input_path, 
+        csv_reader = csv.reader(open(os.path.join(self.input_path, 
                                                   DTA_TIMING_FILE), 
                                      'r'), 
                                 delimiter=',')
         timings = [int(element) for element in next(csv_reader)]
-        csv_reader = csv.reader(open(os.path.join(DEFAULT_DTA_INPUT_PATH, 
+        csv_reader = csv.reader(open(os.path.join(self.input_path, 
                                                   DTA_TESTING_PAIR_FILE),
                                      'r'),
                                 delimiter=',')
         testing_pair = [int(element) for element in next(csv_reader)]
-        csv_reader = csv.reader(open(os.path.join(DEFAULT_DTA_INPUT_PATH,
+        csv_reader = csv.reader(open(os.path.join(self.input_path,
                                                   DTA_INPUT_FILE),
                                      'r'),
                                 delimiter=',')
         inputs = [int(element) for element in next(csv_reader)]
         
         return timings, testing_pair, inputs
+
+    def __read_modulus(self) -> 'tuple(int, int)':
+        """Read the RSA modulus and the bit length of the secret exponent.
+
+        The file is optional, without it the modulus of the provided example data is used.
+
+        Returns:
+            tuple(int, int): The modulus and the number of key bits.
+        """
+        modulus_file = os.path.join(self.input_path, DTA_MODULUS_FILE)
+        if not os.path.exists(modulus_file):
+            return DEFAULT_DTA_MODULUS, DEFAULT_DTA_KEY_BITS
+        with open(modulus_file, 'r') as file:
+            modulus, key_bits = next(csv.reader(file, delimiter=','))
+        return int(modulus, 0), int(key_bits)
     
 class DFAReader(Reader):
     def __init__(self, input_path: str) -> None:
@@ -105,20 +252,66 @@ class DFAReader(Reader):
          self.ciphertexts,
          self.faulty_ciphertexts) = self.__read_input_files()
         
-    def __read_input_files(self) -> 'tuple(list, list, list)':
-        plaintexts = []
-        ciphertexts = []
-        faulty_ciphertexts = []
-        csv_reader_faulty_pairs = csv.reader(
-            open(self.input_path, 'r'), 
-            delimiter=',')
-
-        for row in csv_reader_faulty_pairs:
-            plaintexts.append([int(row[0][i:i + 2], 16)
-                            for i in range(2, len(row[0]), 2)])
-            ciphertexts.append([int(row[1][i:i + 2], 16)
-                                        for i in range(2, len(row[1]), 2)])
-            faulty_ciphertexts.append([int(row[2][i:i + 2], 16)
-                                    for i in range(2, len(row[2]), 2)])
-
-        return plaintexts, ciphertexts, faulty_ciphertexts
\ No newline at end of file
+    def __read_input_files(self) -> 'tuple(np.ndarray, np.ndarray, np.ndarray)':
+        """Read the faulty pairs, each as matrix: pair-number x 16 bytes.
+
+        Binary files are memory-mapped, so no data is copied.
+        """
+        if self.input_path.endswith(DFA_BINARY_EXTENSION):
+            blocks = np.load(self.input_path, mmap_mode='r')
+            if blocks.dtype != np.uint8 or blocks.ndim != 3 or blocks.shape[0] != 3 or blocks.shape[2] != 16:
+                raise ValueError("Expected a uint8 array of shape (3, pairs, 16) in " + self.input_path)
+        else:
+            with open(self.input_path, 'r') as file:
+                blocks = parse_dfa_rows([row for row in csv.reader(file, delimiter=',') if row])
+
+        return blocks[0], blocks[1], blocks[2]
+
+
+def parse_dfa_rows(rows: 'list[list[str]]') -> np.ndarray:
+    """Decode rows of the DFA CSV format.
+
+    Args:
+        rows (list[list[str]]): The rows, each with plaintext, ciphertext & faulty ciphertext as '0x' hex strings.
+
+    Returns:
+        np.ndarray: The decoded blocks, shape (3, rows, 16).
+    """
+    data = bytes.fromhex(''.join(field[2:] for row in rows for field in row[:3]))
+    blocks = np.frombuffer(data, dtype=np.uint8).reshape(len(rows), 3, 16)
+    return np.ascontiguousarray(blocks.transpose(1, 0, 2))
+
+
+def convert_dfa_csv(csv_path: str, binary_path: str, chunk_rows: int = DFA_CHUNK_ROWS) -> int:
+    """Convert a DFA campaign from the CSV format to the binary format.
+
+    The CSV file is converted in chunks, so it does not need to fit into memory.
+
+    Args:
+        csv_path (str): The CSV file to read.
+        binary_path (str): The .npy file to write.
+        chunk_rows (int, optional): The number of rows converted at once.
+
+    Returns:
+        int: The number of converted pairs.
+    """
+    with open(csv_path, 'r') as file:
+        pairs = sum(1 for line in file if line.strip())
+    blocks = np.lib.format.open_memmap(binary_path, mode='w+', dtype=np.uint8, shape=(3, pairs, 16))
+
+    start = 0
+    rows = []
+    with open(csv_path, 'r') as file:
+        for row in csv.reader(file, delimiter=','):
+            if not row:
+                continue
+            rows.append(row)
+            if len(rows) == chunk_rows:
+                blocks[:, start:start + len(rows)] = parse_dfa_rows(rows)
+                start += len(rows)
+                rows.clear()
+    if rows:
+        blocks[:, start:start + len(rows)] = parse_dfa_rows(rows)
+    blocks.flush()
+    del blocks
+    return pairs
@@ -1,6 +1,8 @@
 ######################## IMPORT MODULES #############################
 import numpy as np
 import reader as rd
+import instrument
+from checkpoint import decode_ints, encode_ints
 ###################### USEFUL ROUTINES ##############################
 
 class DTA:
@@ -81,8 +83,21 @@ class DTA:
 
         return f, er
 
-    def look_ahead(self, m: int, d: int, n: int, n1: int, s1: int, z2: int):
-        m1 = self.MontgomeryMul(m, z2, n, n1)[0]
+    def to_montgomery(self, n: int, n1: int, z2: int, cache=None) -> 'list[int]':
+        """
+        Convert the input messages into the Montgomery domain
+        cache: optional; Stores the converted inputs for later runs
+        Returns: m * z mod n of every input message m
+        """
+        if cache is not None and 'montgomery_inputs' in cache:
+            return decode_ints(cache.get('montgomery_inputs'))
+        inputs = [self.MontgomeryMul(m, z2, n, n1)[0] for m in self.reader.inputs]
+        if cache is not None:
+            cache.put('montgomery_inputs', encode_ints(inputs))
+        return inputs
+
+    def look_ahead(self, m1: int, d: int, n: int, n1: int, s1: int):
+        # m1 is the input in the Montgomery domain, see to_montgomery()
         er = 0
         # Since we saved the signatures from previous iterations,
         # we only need to calculate the last step.
@@ -92,16 +107,22 @@ class DTA:
         
         return s1, er
 
-    def perform_timing_attack(self):
+    def perform_timing_attack(self, checkpoint=None, cache=None):
         """
         Timing attack
-        Returns: Secret key d (64 bit integer number)
+        checkpoint: optional; Saves the recovered bits of d & the signatures,
+            a resumed checkpoint continues with the next bit
+        cache: optional; Stores the inputs in the Montgomery domain
+        Returns: Secret key d (integer number with key_bits bits)
         """
 
-        n = int(0xB935E2B84B83E9EB)  # modulus
-        z = int(pow(2, 64))
+        n = self.reader.modulus
+        z = int(pow(2, n.bit_length()))
         z2 = int(pow(z, 2, n))
         n1 = self.modInvEuclid(-n, z)
+        # The inputs are converted once instead of in every look-ahead
+        with instrument.stage('dta.to_montgomery'):
+            montgomery_inputs = self.to_montgomery(n, n1, z2, cache)
         
         d = int(0)
         
@@ -115,10 +136,17 @@ class DTA:
         signatures_1 = []
         signatures = self.reader.inputs.copy()
         
-        # Square & Multiply the input messages once
-        signatures = [self.look_ahead(sig, d, n, n1, z, z2)[0] for sig in signatures]
-        # Key extraction for bits 1 to 62
-        for i in range(1, 63):
+        first_bit = 1
+        if checkpoint is not None and 'd' in checkpoint.state:
+            d = decode_ints(checkpoint.state['d'])[0]
+            first_bit = int(checkpoint.state['bit'])
+            signatures = decode_ints(checkpoint.state['signatures'])
+        else:
+            # Square & Multiply the input messages once
+            with instrument.stage('dta.look_ahead'):
+                signatures = [self.look_ahead(m1, d, n, n1, z)[0] for m1 in montgomery_inputs]
+        # Key extraction for bits 1 to key_bits - 2
+        for i in range(first_bit, self.reader.key_bits - 1):
             # Key Hypotheses for the next bit
             d_0 = d << 1
             d_1 = (d << 1) | 1
@@ -128,27 +156,34 @@ class DTA:
             # can copy the correct list to the signatures list.
             # Copying the signatures, instead of re-calculating them
             # saves a lot of time. 
-            for input, signature in zip(self.reader.inputs, signatures):
-                s_0, e_0 = self.look_ahead(input, d_0, n, n1, signature, z2)
-                signatures_0.append(s_0)
-                extra_reductions_0.append(e_0)
-                s_1, e_1 = self.look_ahead(input, d_1, n, n1, signature, z2)
-                signatures_1.append(s_1)
-                extra_reductions_1.append(e_1)
+            with instrument.stage('dta.look_ahead'):
+                for m1, signature in zip(montgomery_inputs, signatures):
+                    s_0, e_0 = self.look_ahead(m1, d_0, n, n1, signature)
+                    signatures_0.append(s_0)
+                    extra_reductions_0.append(e_0)
+                    s_1, e_1 = self.look_ahead(m1, d_1, n, n1, signature)
+                    signatures_1.append(s_1)
+                    extra_reductions_1.append(e_1)
+            instrument.count('dta.look_aheads', 2 * len(signatures))
                 
             # Compare the correlation coefficients of the timings and the extra reductions
             # Chose the one with the higher correlation coefficient.
-            if abs(np.corrcoef(self.reader.timings, extra_reductions_0)[0,1]) < abs(np.corrcoef(self.reader.timings, extra_reductions_1)[0,1]):
-                d = d_1 
-                signatures = signatures_1.copy()
-            else:
-                d = d_0
-                signatures = signatures_0.copy()
+            with instrument.stage('dta.correlation'):
+                if abs(np.corrcoef(self.reader.timings, extra_reductions_0)[0,1]) < abs(np.corrcoef(self.reader.timings, extra_reductions_1)[0,1]):
+                    d = d_1 
+                    signatures = signatures_1.copy()
+                else:
+                    d = d_0
+                    signatures = signatures_0.copy()
             
             # Print the current key byte
             if i % 4 == 3:
                 print(hex(d)[2:].upper(), end="\r")
             
+            # Encoding the signatures takes a while, only do it when they are written
+            if checkpoint is not None and checkpoint.due():
+                checkpoint.update(d=encode_ints([d]), bit=np.array(i + 1), signatures=encode_ints(signatures))
+
             # Reset
             extra_reductions_0.clear()
             extra_reductions_1.clear()
@@ -158,10 +193,11 @@ class DTA:
         # Test the last bit
         d_0 = d << 1
         d_1 = (d << 1) | 1
-        if self.testPair(self.reader.testing_pair, d_0, n):
-            d = d_0
-        else:
-            d = d_1
+        with instrument.stage('dta.test_pair'):
+            if self.testPair(self.reader.testing_pair, d_0, n):
+                d = d_0
+            else:
+                d = d_1
         # Make sure that the secret key is correct
         assert(self.testPair(self.reader.testing_pair, d, n))
         
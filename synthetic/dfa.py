@@ -0,0 +1,93 @@
+"""
+Synthetic faulty ciphertext pairs for the DFA.
+
+A random non-zero single byte fault is XORed into the state at the input of a
+chosen round of a NumPy AES. By default the fault hits byte 0 at the input of
+round 8, which spreads into one byte per column before the last MixColumns as
+expected by DFA.perform_dfa(). A fault at the input of round 9 only affects
+one column of the ciphertext.
+
+The pairs are streamed chunk by chunk either to a CSV file, encoded to hex
+without a Python loop per row, or to the binary format of DFAReader.
+"""
+import numpy as np
+import reader as rd
+from aes.cipher import encrypt, expand_key
+
+FAULT_ROUND = 8
+FAULT_BYTE = 0
+CHUNK_PAIRS = 1 << 16
+
+HEX_DIGITS = np.frombuffer(b'0123456789ABCDEF', dtype=np.uint8)
+# '0x' + 32 hex digits per block, 3 blocks separated by ',' and terminated by '\n'
+BLOCK_WIDTH = 34
+ROW_WIDTH = 3 * (BLOCK_WIDTH + 1)
+
+
+def encode_rows(plaintexts: np.ndarray, ciphertexts: np.ndarray, faulty_ciphertexts: np.ndarray) -> bytes:
+    """Encode a batch of pairs as lines of the CSV format of DFAReader.
+
+    Args:
+        plaintexts (np.ndarray): The plaintexts, shape (N, 16).
+        ciphertexts (np.ndarray): The correct ciphertexts, shape (N, 16).
+        faulty_ciphertexts (np.ndarray): The faulty ciphertexts, shape (N, 16).
+
+    Returns:
+        bytes: The encoded lines.
+    """
+    rows = np.empty((len(plaintexts), ROW_WIDTH), dtype=np.uint8)
+    for i, blocks in enumerate((plaintexts, ciphertexts, faulty_ciphertexts)):
+        begin = i * (BLOCK_WIDTH + 1)
+        rows[:, begin] = ord('0')
+        rows[:, begin + 1] = ord('x')
+        rows[:, begin + 2:begin + BLOCK_WIDTH:2] = HEX_DIGITS[blocks >> 4]
+        rows[:, begin + 3:begin + BLOCK_WIDTH:2] = HEX_DIGITS[blocks & 0x0F]
+        rows[:, begin + BLOCK_WIDTH] = ord(',')
+    rows[:, -1] = ord('\n')
+    return rows.tobytes()
+
+
+def generate_pairs(round_keys: np.ndarray, n_pairs: int, fault_round: int, fault_byte: int,
+                   chunk_pairs: int, rng: np.random.Generator):
+    """Yield the start index and the plaintexts, ciphertexts & faulty ciphertexts of every chunk."""
+    for start in range(0, n_pairs, chunk_pairs):
+        rows = min(chunk_pairs, n_pairs - start)
+        plaintexts = rng.integers(0, 256, (rows, 16), dtype=np.uint8)
+        faults = rng.integers(1, 256, rows, dtype=np.uint8)
+        ciphertexts = encrypt(plaintexts, round_keys)
+        faulty_ciphertexts = encrypt(plaintexts, round_keys, fault_round, fault_byte, faults)
+        yield start, (plaintexts, ciphertexts, faulty_ciphertexts)
+
+
+def generate(path: str, n_pairs: int, key=None, fault_round: int = FAULT_ROUND, fault_byte: int = FAULT_BYTE,
+             chunk_pairs: int = CHUNK_PAIRS, seed: int = None) -> np.ndarray:
+    """Write a synthetic DFA dataset in a format of DFAReader.
+
+    Args:
+        path (str): The file to create, binary if it ends with .npy, CSV otherwise.
+        n_pairs (int): The number of faulty pairs.
+        key (optional): The 16 byte AES key, random if not given.
+        fault_round (int, optional): The round at whose input the fault is injected.
+        fault_byte (int, optional): The state byte the fault is injected into.
+        chunk_pairs (int, optional): Number of pairs generated at once.
+        seed (int, optional): Seed of the random generator.
+
+    Returns:
+        np.ndarray: The AES key.
+    """
+    rng = np.random.default_rng(seed)
+    if key is None:
+        key = rng.integers(0, 256, 16, dtype=np.uint8)
+    round_keys = expand_key(key)
+    chunks = generate_pairs(round_keys, n_pairs, fault_round, fault_byte, chunk_pairs, rng)
+
+    if path.endswith(rd.DFA_BINARY_EXTENSION):
+        blocks = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=(3, n_pairs, 16))
+        for start, chunk in chunks:
+            blocks[:, start:start + len(chunk[0])] = chunk
+        blocks.flush()
+    else:
+        with open(path, 'wb') as file:
+            for _, chunk in chunks:
+                file.write(encode_rows(*chunk))
+    return np.asarray(key, dtype=np.uint8)
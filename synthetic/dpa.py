@@ -0,0 +1,134 @@
+"""
+Synthetic power traces of an AES-128 last round for the DPA.
+
+Every state byte before the last SubBytes leaks at one sample point, either
+with its Hamming weight or with the Hamming distance to the ciphertext byte
+that overwrites it. With Boolean masking, the state byte itself never leaks,
+but its two shares, a random mask & the masked byte, leak at two sample
+points. Gaussian noise and a random shift per trace (jitter) are added on
+top. The traces are streamed chunk by chunk into the HDF5 layout of
+DPAReader, so datasets much larger than the memory can be created.
+"""
+import h5py
+import numpy as np
+from aes.cipher import encrypt, expand_key
+from aes.tables import HW, SBOX_INV
+
+HW_MODEL = 'hw'
+HD_MODEL = 'hd'
+LEAKAGE_MODELS = (HW_MODEL, HD_MODEL)
+# Memory budget for the floating point traces of one chunk
+CHUNK_BYTES = 1 << 26
+
+
+def leakage(ciphertexts: np.ndarray, last_round_key: np.ndarray, model: str = HW_MODEL,
+            masks: np.ndarray = None) -> np.ndarray:
+    """Compute the leakage of the last round for every ciphertext byte.
+
+    Args:
+        ciphertexts (np.ndarray): The ciphertexts, shape (N, 16).
+        last_round_key (np.ndarray): The 16 byte last round key.
+        model (str, optional): The leakage model, 'hw' or 'hd'.
+        masks (np.ndarray, optional): Masks of the state bytes, shape (N, 16), the leakage of the masked state.
+
+    Returns:
+        np.ndarray: The leakage, shape (N, 16).
+    """
+    state = SBOX_INV[ciphertexts ^ last_round_key]
+    if masks is not None:
+        state ^= masks
+    if model == HD_MODEL:
+        return HW[state ^ ciphertexts]
+    return HW[state]
+
+
+def leakage_points(n_samples: int, jitter: int, shares: int = 1) -> np.ndarray:
+    """The sample points at which the shares of the 16 state bytes leak without jitter.
+
+    The shares of a byte leak one after the other, i.e. share j of byte i at point shares * i + j.
+    """
+    if n_samples < 16 * shares + 2 * jitter:
+        raise ValueError("A trace needs at least {} + 2 * jitter samples.".format(16 * shares))
+    return np.linspace(jitter, n_samples - 1 - jitter, 16 * shares).astype(np.intp)
+
+
+def generate_traces(round_keys: np.ndarray, n_traces: int, n_samples: int, model: str, noise: float, gain: float,
+                    jitter: int, dtype: np.dtype, chunk_traces: int, rng: np.random.Generator, masked: bool = False):
+    """Yield the start index and the traces, ciphertexts & plaintexts of every chunk."""
+    points = leakage_points(n_samples, jitter, 2 if masked else 1)
+    info = np.iinfo(dtype)
+    offset = (int(info.min) + int(info.max) + 1) / 2
+    for start in range(0, n_traces, chunk_traces):
+        rows = min(chunk_traces, n_traces - start)
+        plaintexts = rng.integers(0, 256, (rows, 16), dtype=np.uint8)
+        ciphertexts = encrypt(plaintexts, round_keys)
+
+        traces = rng.standard_normal((rows, n_samples), dtype=np.float32)
+        traces *= noise
+        traces += offset
+        shift = rng.integers(-jitter, jitter + 1, (rows, 1)) if jitter else 0
+        if masked:
+            masks = rng.integers(0, 256, (rows, 16), dtype=np.uint8)
+            # Mask & masked byte of every state byte next to each other
+            values = np.stack([HW[masks], leakage(ciphertexts, round_keys[10], model, masks)], axis=2)
+            values = values.reshape(rows, 32)
+        else:
+            values = leakage(ciphertexts, round_keys[10], model)
+        signal = gain * (values.astype(np.float32) - 4.0)
+        traces[np.arange(rows)[:, None], points + shift] += signal
+        np.rint(traces, out=traces)
+        np.clip(traces, info.min, info.max, out=traces)
+        yield start, (traces.astype(dtype), ciphertexts, plaintexts)
+
+
+def generate(path: str, n_traces: int, n_samples: int, key=None, model: str = HW_MODEL,
+             noise: float = 1.0, gain: float = 8.0, jitter: int = 0, dtype: str = 'uint8',
+             chunk_traces: int = None, compression: str = None, masked: bool = False,
+             seed: int = None) -> np.ndarray:
+    """Write a synthetic DPA dataset.
+
+    Args:
+        path (str): The HDF5 file to create.
+        n_traces (int): The number of traces.
+        n_samples (int): The number of samples per trace, at least 16 + 2 * jitter.
+        key (optional): The 16 byte AES key, random if not given.
+        model (str, optional): The leakage model, 'hw' or 'hd'.
+        noise (float, optional): Standard deviation of the Gaussian noise.
+        gain (float, optional): Amplitude of one bit of leakage.
+        jitter (int, optional): Maximum shift of a trace in samples.
+        dtype (str, optional): Integer type the traces are quantised to.
+        chunk_traces (int, optional): Number of traces generated at once, derived from CHUNK_BYTES if not given.
+        compression (str, optional): HDF5 compression filter of the traces, e.g. 'gzip' or 'lzf'.
+        masked (bool, optional): Whether the state bytes are masked, which needs at least 32 + 2 * jitter samples.
+        seed (int, optional): Seed of the random generator.
+
+    Returns:
+        np.ndarray: The AES key.
+    """
+    if model not in LEAKAGE_MODELS:
+        raise ValueError("Unknown leakage model {}.".format(model))
+    rng = np.random.default_rng(seed)
+    if key is None:
+        key = rng.integers(0, 256, 16, dtype=np.uint8)
+    round_keys = expand_key(key)
+    # Fail before the file is created
+    leakage_points(n_samples, jitter, 2 if masked else 1)
+    dtype = np.dtype(dtype)
+    if not chunk_traces:
+        chunk_traces = max(1, CHUNK_BYTES // (4 * n_samples))
+    chunk_traces = min(chunk_traces, max(n_traces, 1))
+    chunks = generate_traces(round_keys, n_traces, n_samples, model, noise, gain, jitter, dtype, chunk_traces, rng,
+                             masked)
+
+    with h5py.File(path, 'w') as file:
+        traces_set = file.create_dataset('traces', (n_traces, n_samples), dtype=dtype,
+                                         chunks=(min(chunk_traces, 1024), n_samples), compression=compression)
+        ciphertext_set = file.create_dataset('ciphertext', (n_traces, 16), dtype=np.uint8)
+        plaintext_set = file.create_dataset('plaintext', (n_traces, 16), dtype=np.uint8)
+
+        for start, (traces, ciphertexts, plaintexts) in chunks:
+            stop = start + len(traces)
+            traces_set[start:stop] = traces
+            ciphertext_set[start:stop] = ciphertexts
+            plaintext_set[start:stop] = plaintexts
+    return np.asarray(key, dtype=np.uint8)
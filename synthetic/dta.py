@@ -0,0 +1,98 @@
+"""
+Synthetic RSA timings for the DTA.
+
+The device computes y^d mod n with a left-to-right square-and-multiply and
+the Montgomery multiplication of rsa_dta.dta.DTA. Every extra reduction adds
+a constant to the execution time, on top of Gaussian noise.
+
+The exponentiation runs on NumPy object arrays, i.e. for a whole chunk of
+messages at once, which works for any modulus size. The messages & timings
+are streamed to the CSV files chunk by chunk.
+"""
+import os
+import random
+import numpy as np
+import reader as rd
+
+CHUNK_TIMINGS = 4096
+BASE_TIME = 100000
+
+
+def montgomery_mul(a, b, n: int, n1: int, bits: int) -> tuple:
+    """Montgomery multiplication of integers or object arrays of integers.
+
+    Returns:
+        tuple: The product and whether an extra reduction was done.
+    """
+    mask = (1 << bits) - 1
+    c = a * b
+    e = c + (((c & mask) * n1) & mask) * n
+    f = e >> bits
+    er = f >= n
+    return np.where(er, f - n, f), er
+
+
+def random_modulus(bits: int, rng: random.Random) -> int:
+    """Random odd modulus with exactly the given number of bits."""
+    return rng.getrandbits(bits) | (1 << (bits - 1)) | 1
+
+
+def count_reductions(inputs: np.ndarray, d: int, key_bits: int, n: int, bits: int) -> np.ndarray:
+    """Count the extra reductions of y^d mod n for an object array of messages y."""
+    z = 1 << bits
+    n1 = -pow(n, -1, z) % z
+    m = montgomery_mul(inputs, z * z % n, n, n1, bits)[0]
+    s = np.full(len(inputs), z % n, dtype=object)
+    reductions = np.zeros(len(inputs), dtype=np.int64)
+    for i in reversed(range(key_bits)):
+        s, er = montgomery_mul(s, s, n, n1, bits)
+        reductions += er
+        if (d >> i) & 1:
+            s, er = montgomery_mul(s, m, n, n1, bits)
+            reductions += er
+    return reductions
+
+
+def generate(path: str, n_timings: int, modulus_bits: int = 64, key_bits: int = None,
+             reduction_cost: int = 21101, noise: float = 5000.0, chunk_timings: int = CHUNK_TIMINGS,
+             seed: int = None) -> int:
+    """Write a synthetic DTA dataset in the input folder layout of DTAReader.
+
+    Args:
+        path (str): The folder to write the CSV files to.
+        n_timings (int): The number of input messages & timings.
+        modulus_bits (int, optional): The bit length of the modulus.
+        key_bits (int, optional): The bit length of the secret exponent, defaults to modulus_bits.
+        reduction_cost (int, optional): The time an extra reduction takes.
+        noise (float, optional): Standard deviation of the Gaussian noise.
+        chunk_timings (int, optional): Number of timings simulated at once.
+        seed (int, optional): Seed of the random generator.
+
+    Returns:
+        int: The secret exponent d.
+    """
+    rng = random.Random(seed)
+    noise_rng = np.random.default_rng(seed)
+    key_bits = key_bits or modulus_bits
+    n = random_modulus(modulus_bits, rng)
+    d = rng.getrandbits(key_bits) | (1 << (key_bits - 1))
+
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, rd.DTA_INPUT_FILE), 'w') as input_file, \
+         open(os.path.join(path, rd.DTA_TIMING_FILE), 'w') as timing_file:
+        for start in range(0, n_timings, chunk_timings):
+            rows = min(chunk_timings, n_timings - start)
+            inputs = np.array([rng.randrange(n) for _ in range(rows)], dtype=object)
+            reductions = count_reductions(inputs, d, key_bits, n, modulus_bits)
+            timings = (BASE_TIME + reductions * reduction_cost
+                       + noise_rng.normal(0.0, noise, rows)).astype(np.int64)
+            separator = ',' if start else ''
+            input_file.write(separator + ','.join(map(str, inputs)))
+            timing_file.write(separator + ','.join(map(str, timings)))
+
+    testing_y = rng.randrange(n)
+    with open(os.path.join(path, rd.DTA_TESTING_PAIR_FILE), 'w') as file:
+        file.write('{},{}'.format(testing_y, pow(testing_y, d, n)))
+    with open(os.path.join(path, rd.DTA_MODULUS_FILE), 'w') as file:
+        file.write('{},{}'.format(hex(n), key_bits))
+    return d
@@ -0,0 +1,97 @@
+"""
+Stand-in for a measurement setup feeding the live DPA.
+
+Synthetic traces of synthetic.dpa are sent batch by batch at a given rate to
+a Unix socket, to the standard output or appended to an HDF5 file in SWMR
+mode, in the formats read by aes_dpa.live. The feed stops early when the
+live DPA closes the connection.
+"""
+import socket
+import sys
+import time
+import numpy as np
+from aes.cipher import expand_key
+from aes_dpa.live import encode_header, encode_records
+from synthetic.dpa import HW_MODEL, LEAKAGE_MODELS, generate_traces, leakage_points
+
+BATCH_TRACES = 100
+
+
+def send_stream(write, chunks, n_samples: int, dtype: np.dtype, rate: float) -> int:
+    """Send the header & the records of the chunks with write(), returns the number of traces sent."""
+    sent = 0
+    start = time.monotonic()
+    try:
+        write(encode_header(n_samples, dtype))
+        for _, (traces, ciphertexts, plaintexts) in chunks:
+            write(encode_records(traces, plaintexts, ciphertexts))
+            sent += len(traces)
+            if rate:
+                time.sleep(max(0.0, start + sent / rate - time.monotonic()))
+    except (BrokenPipeError, ConnectionResetError):
+        # The live DPA has found the key and stopped the capture
+        pass
+    return sent
+
+
+def append_hdf5(path: str, chunks, n_samples: int, dtype: np.dtype, rate: float) -> int:
+    """Append the chunks to a growing HDF5 file in SWMR mode, returns the number of traces written."""
+    import h5py
+    written = 0
+    start = time.monotonic()
+    with h5py.File(path, 'w', libver='latest') as file:
+        traces_set = file.create_dataset('traces', (0, n_samples), dtype=dtype, maxshape=(None, n_samples),
+                                         chunks=(BATCH_TRACES, n_samples))
+        plaintext_set = file.create_dataset('plaintext', (0, 16), dtype=np.uint8, maxshape=(None, 16))
+        ciphertext_set = file.create_dataset('ciphertext', (0, 16), dtype=np.uint8, maxshape=(None, 16))
+        file.swmr_mode = True
+        for _, (traces, ciphertexts, plaintexts) in chunks:
+            stop = written + len(traces)
+            # The ciphertexts last, the reader takes a record as complete once they are there
+            for dataset, data in ((traces_set, traces), (plaintext_set, plaintexts), (ciphertext_set, ciphertexts)):
+                dataset.resize(stop, axis=0)
+                dataset[written:stop] = data
+                dataset.flush()
+            written = stop
+            if rate:
+                time.sleep(max(0.0, start + written / rate - time.monotonic()))
+    return written
+
+
+def feed(target: str, n_traces: int, n_samples: int, key=None, model: str = HW_MODEL, noise: float = 1.0,
+         gain: float = 8.0, jitter: int = 0, dtype: str = 'uint8', rate: float = None,
+         batch_traces: int = BATCH_TRACES, seed: int = None) -> 'tuple(np.ndarray, int)':
+    """Feed synthetic traces to the live DPA.
+
+    Args:
+        target (str): A Unix socket to connect to, '-' for the standard output or an HDF5 file (.h5, .hdf5).
+        n_traces (int): The maximum number of traces.
+        n_samples (int): The number of samples per trace.
+        key (optional): The 16 byte AES key, random if not given.
+        model, noise, gain, jitter, dtype: The leakage, see synthetic.dpa.generate().
+        rate (float, optional): Traces per second, as fast as possible if not given.
+        batch_traces (int, optional): Number of traces sent at once.
+        seed (int, optional): Seed of the random generator.
+
+    Returns:
+        tuple(np.ndarray, int): The AES key and the number of traces sent.
+    """
+    if model not in LEAKAGE_MODELS:
+        raise ValueError("Unknown leakage model {}.".format(model))
+    rng = np.random.default_rng(seed)
+    if key is None:
+        key = rng.integers(0, 256, 16, dtype=np.uint8)
+    leakage_points(n_samples, jitter)
+    dtype = np.dtype(dtype)
+    chunks = generate_traces(expand_key(key), n_traces, n_samples, model, noise, gain, jitter, dtype,
+                             batch_traces, rng)
+
+    if target.endswith(('.h5', '.hdf5')):
+        sent = append_hdf5(target, chunks, n_samples, dtype, rate)
+    elif target == '-':
+        sent = send_stream(sys.stdout.buffer.write, chunks, n_samples, dtype, rate)
+    else:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(target)
+            sent = send_stream(connection.sendall, chunks, n_samples, dtype, rate)
+    return np.asarray(key, dtype=np.uint8), sent